@@ -1,14 +1,30 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash
-from flask_mysqldb import MySQL
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, stream_with_context
+from db_pool import MySQLPool
 from sql_tools import *
 from html_tools import *
+from schema_catalog import catalog
+from fragment_cache import fragments
+from search_index import search_index, SEARCH_TABLES
+from license_tools import *
+from audit_log import audit
+from session_store import make_session_interface
+from authz import can_access_table, accessible_tables, software_access_cache
+from metrics import metrics
 import MySQLdb.cursors
 import re
 import os
+import io
+import csv
+import json
 import secrets
 import hashlib
-import uuid
+import hmac
+import threading
+import time
 from functools import wraps
+from werkzeug.serving import is_running_from_reloader
+from werkzeug.middleware.proxy_fix import ProxyFix
+from datetime import datetime
 
 import flask
 
@@ -29,14 +45,62 @@ def get_db_password():
     except:
         return None
     
+# Session data is kept on the server, the cookie only carries the session id.
+# SESSION_BACKEND: 'memory' (one worker process), 'sqlite' (several workers on one host) or 'cookie'
+app.config['SESSION_BACKEND'] = os.environ.get('SESSION_BACKEND', 'memory')
+app.config['SESSION_SQLITE_PATH'] = os.environ.get('SESSION_SQLITE_PATH', 'sessions.sqlite3')
+app.config['SESSION_TTL'] = int(os.environ.get('SESSION_TTL', 8 * 3600))
+session_interface = make_session_interface(app)
+if session_interface is not None:
+    app.session_interface = session_interface
+
 # Enter your mysql connection details here
 app.config['MYSQL_HOST'] = '127.0.0.1'
 app.config['MYSQL_USER'] = 'root'
 app.config['MYSQL_PASSWORD'] = get_db_password()
 app.config['MYSQL_DB'] = 'cifdb'
 
-# Initialize MySQL
-mysql = MySQL(app)
+# Connection pool settings
+app.config['MYSQL_POOL_SIZE'] = int(os.environ.get('MYSQL_POOL_SIZE', 10))
+app.config['MYSQL_POOL_TIMEOUT'] = float(os.environ.get('MYSQL_POOL_TIMEOUT', 10))
+app.config['MYSQL_POOL_RECYCLE'] = float(os.environ.get('MYSQL_POOL_RECYCLE', 300))
+
+# Rows shown per page on /edit
+app.config['EDIT_PAGE_SIZE'] = int(os.environ.get('EDIT_PAGE_SIZE', 50))
+
+# Rows per executemany/commit when importing files
+app.config['IMPORT_CHUNK_SIZE'] = int(os.environ.get('IMPORT_CHUNK_SIZE', 500))
+
+# Tables whose rendered /edit pages are cached, and the size of that cache
+app.config['FRAGMENT_CACHE_TABLES'] = {'equipment', 'consumable_inventory', 'software'}
+fragments.max_bytes = int(os.environ.get('FRAGMENT_CACHE_BYTES', 8 * 1024 * 1024))
+
+# Seconds between recomputations of the license seat counts (0 disables them)
+app.config['LICENSE_RECONCILE_INTERVAL'] = float(os.environ.get('LICENSE_RECONCILE_INTERVAL', 300))
+
+# LicenseAudit rows are written in batches in the background, unless AUDIT_STRICT is set
+app.config['AUDIT_STRICT'] = os.environ.get('AUDIT_STRICT', '') == '1'
+app.config['AUDIT_QUEUE_SIZE'] = int(os.environ.get('AUDIT_QUEUE_SIZE', 10000))
+app.config['AUDIT_BATCH_SIZE'] = int(os.environ.get('AUDIT_BATCH_SIZE', 200))
+app.config['AUDIT_FLUSH_INTERVAL'] = float(os.environ.get('AUDIT_FLUSH_INTERVAL', 1))
+app.config['AUDIT_SPILL_FILE'] = os.environ.get('AUDIT_SPILL_FILE', 'license_audit_spill.jsonl')
+
+# Addresses allowed to scrape /metrics without logging in (comma separated). They are compared with
+# request.remote_addr: behind a reverse proxy set PROXY_COUNT so it is the client's address, not the proxy's
+app.config['METRICS_ALLOWED_IPS'] = {ip.strip() for ip in os.environ.get('METRICS_ALLOWED_IPS', '127.0.0.1').split(',') if ip.strip()}
+
+# Number of reverse proxies in front of the app whose X-Forwarded-For/-Proto/-Host headers are trusted (0: none).
+# Only set it when the app cannot be reached without going through them, or clients can forge their address
+app.config['PROXY_COUNT'] = int(os.environ.get('PROXY_COUNT', 0))
+if app.config['PROXY_COUNT']:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_COUNT'], x_proto=app.config['PROXY_COUNT'],
+                            x_host=app.config['PROXY_COUNT'])
+
+# Initialize the MySQL connection pool
+mysql = MySQLPool(app)
+audit.init_app(app, mysql.pool.connection)
+# Per route latency and SQL statistics, served at /metrics
+metrics.init_app(app, mysql)
 
 # Create a login_required decorator to protect routes
 def login_required(f):
@@ -62,83 +126,45 @@ def login():
             msg = 'Invalid role selected!'
             return render_template('login.html', error=msg)
         
-        # First check if the user is an admin
-        cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
-        
-        # Admin can be identified by either username or email
-        # First try username
-        cursor.execute('SELECT * FROM users WHERE name = %s AND password = %s AND role = %s',
-                      (username, password, "Admin"))
-        admin_account = cursor.fetchone()
-        
-        # If not found, try email
-        if not admin_account:
-            cursor.execute('SELECT * FROM users WHERE email = %s AND password = %s AND role = %s',
-                         (username, password, "Admin"))
-            admin_account = cursor.fetchone()
-        
-        # If still not found, try with hashed password
-        if not admin_account:
-            # Hash the password for comparison
-            hashed_password = hashlib.sha256(password.encode()).hexdigest()
-            
-            # Try username with hashed password
-            cursor.execute('SELECT * FROM users WHERE name = %s AND password = %s AND role = %s',
-                         (username, hashed_password, "Admin"))
-            admin_account = cursor.fetchone()
-            
-            # If still not found, try email with hashed password
-            if not admin_account:
-                cursor.execute('SELECT * FROM users WHERE email = %s AND password = %s AND role = %s',
-                             (username, hashed_password, "Admin"))
-                admin_account = cursor.fetchone()
-        
-        # If user is an admin, allow them to login as any role
-        if admin_account and authority != "Admin":
-            # Admin is logging in as another role
-            session['bool'] = True
-            session['username'] = admin_account['name']
-            session['email'] = admin_account['email']
-            session['authority'] = authority  # Use the selected role
-            session['id'] = admin_account['id']  # Store user ID in session
-            msg = 'Logged in successfully as ' + authority + '!'
-            return redirect(url_for('index'))
-        
-        # Regular authentication for non-admin users or admins logging in as admin
-        # Try username first
-        cursor.execute('SELECT * FROM users WHERE name = %s AND password = %s AND role = %s',
-                      (username, password, authority))
-        account = cursor.fetchone()
-        
-        # If not found, try email
-        if not account:
-            cursor.execute('SELECT * FROM users WHERE email = %s AND password = %s AND role = %s',
-                         (username, password, authority))
-            account = cursor.fetchone()
-        
-        # If still not found, try with hashed password
-        if not account:
-            # Hash the password for comparison
-            hashed_password = hashlib.sha256(password.encode()).hexdigest()
-            
-            # Try username with hashed password
-            cursor.execute('SELECT * FROM users WHERE name = %s AND password = %s AND role = %s',
-                         (username, hashed_password, authority))
-            account = cursor.fetchone()
-            
-            # If still not found, try email with hashed password
-            if not account:
-                cursor.execute('SELECT * FROM users WHERE email = %s AND password = %s AND role = %s',
-                             (username, hashed_password, authority))
-                account = cursor.fetchone()
-        
+        # One indexed lookup by name or email, the password and role are checked in Python
+        cursor = mysql.connection.cursor()
+        cursor.execute('SELECT id, name, email, password, role FROM users WHERE name = %s OR email = %s',
+                       (username, username))
+        candidates = fetch_all(cursor)
+
+        hashed_password = hashlib.sha256(password.encode()).hexdigest()
+        account = None
+        for candidate in candidates:
+            stored = candidate['password'].encode()
+            hashed_match = hmac.compare_digest(stored, hashed_password.encode())
+            # A stored sha256 digest is never a plaintext password, even if the digest itself was submitted
+            legacy = not re.fullmatch(r'[0-9a-f]{64}', candidate['password'])
+            if not hashed_match and not (legacy and hmac.compare_digest(stored, password.encode())):
+                continue
+            if not hashed_match:
+                # Legacy plaintext password: replace it with its hash, so this only happens once per user
+                cursor.execute('UPDATE users SET password = %s WHERE id = %s', (hashed_password, candidate['id']))
+                mysql.connection.commit()
+            # Admins can log in as any role, everyone else only with their own role
+            if candidate['role'] == 'Admin' or candidate['role'] == authority:
+                account = candidate
+                break
+        cursor.close()
+
         if account:
+            # Logged in (or other privileges): never under the session id the browser came with
+            if session_interface is not None:
+                session_interface.regenerate(session)
             session['bool'] = True
             session['username'] = account['name']
             session['email'] = account['email']
-            session['authority'] = authority
+            session['authority'] = authority  # Admins may have chosen another role
             session['id'] = account['id']  # Store user ID in session
-            msg = 'Logged in successfully!'
+            software_access_cache.load(mysql, account['id'])
+            if account['role'] == 'Admin' and authority != 'Admin':
+                msg = 'Logged in successfully as ' + authority + '!'
+            else:
+                msg = 'Logged in successfully!'
             return redirect(url_for('index'))
         else:
             msg = 'Incorrect username/password/role!'
@@ -154,6 +180,40 @@ def test_connection():
         return f"Connection works! Result: {result}"
     except Exception as e:
         return f"Error: {str(e)}"
+
+@app.route('/fragment_cache')
+@login_required
+def fragment_cache_status():
+    # Rendered table cache hit/miss counters, for administrators
+    if session.get('authority') != 'Admin':
+        return render_template('error.html', error="You do not have permission to access this page")
+    return jsonify(fragments.stats())
+
+
+@app.route('/db_pool')
+@login_required
+def db_pool_status():
+    # Connection pool usage, for administrators
+    if session.get('authority') != 'Admin':
+        return render_template('error.html', error="You do not have permission to access this page")
+    return jsonify(mysql.pool.stats())
+
+@app.route('/metrics')
+def metrics_endpoint():
+    # Prometheus scrape target: request latency, SQL statements, DB time and rows per route, plus the cache and
+    # pool statistics (counters for the cumulative ones, gauges for the others, see metrics.CUMULATIVE_STATS)
+    if request.remote_addr not in app.config['METRICS_ALLOWED_IPS'] and session.get('authority') != 'Admin':
+        return app.response_class("Forbidden\n", status=403, mimetype='text/plain')
+    stats = {
+        'db_pool': mysql.pool.stats(),
+        'fragment_cache': fragments.stats(),
+        'search_index': search_index.stats(),
+        'license_audit': audit.stats(),
+    }
+    if session_interface is not None:
+        stats['session_store'] = session_interface.stats()
+    return app.response_class(metrics.render(stats), mimetype='text/plain; version=0.0.4')
+
 # about us url
 
 # second
@@ -255,40 +315,24 @@ def pick_table():
         
     authority = session.get('authority')
     
-    # Define accessible tables for each role (case-insensitive matching)
-    accessible_tables = {
-        'Admin': None,  # None means all tables - Admin has full access
-        'Staff': ["equipment", "lab_visits", "maintenance_visits", "consumable_inventory", "software", "vendors"],  # Staff has view-only access to these tables
-        'Visitor': ["equipment", "consumable_inventory", "software", "maintenance_visits"]
-    }
-    
     # Get all available tables
     tables = show_tables(mysql)
     
     # Generate the dropdown options based on role
     if authority == 'Admin':
         options = nested_list_to_html_select(tables)
-    elif authority == 'Staff':
-        # Only show allowed tables for Staff
-        options = ""
-        for table in tables:
-            if table[0].lower() in accessible_tables['Staff']:
-                options += f"<option value='{table[0]}'>{table[0]}</option>"
-    else:  # Visitor
-        # Only show allowed tables for Visitors
+    else:
+        # Only show the tables the role may open
         options = ""
-        for table in tables:
-            if table[0].lower() in accessible_tables['Visitor']:
-                options += f"<option value='{table[0]}'>{table[0]}</option>"
+        for table in accessible_tables(authority, [t[0] for t in tables[1:]]):
+            options += f"<option value='{table}'>{table}</option>"
                 
     # Handle form submissions
     if request.method == 'POST' and 'table' in request.form:
         selected_table = request.form['table']
         
         # Check if user has permission to access this table
-        if authority == 'Staff' and selected_table.lower() not in accessible_tables['Staff']:
-            return render_template('error.html', error=f"You do not have permission to access the {selected_table} table")
-        elif authority == 'Visitor' and selected_table.lower() not in accessible_tables['Visitor']:
+        if not can_access_table(authority, selected_table):
             return render_template('error.html', error=f"You do not have permission to access the {selected_table} table")
 
         if 'pick' in request.form:
@@ -319,6 +363,10 @@ def pick_table():
                 cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
                 cursor.execute(f"ALTER TABLE {table} RENAME TO {new_name}")
                 mysql.connection.commit()
+                catalog.invalidate()
+                fragments.bump(table)
+                fragments.bump(new_name)
+                search_index.rename(table, new_name)
 
                 session['table_name'] = new_name
                 return redirect(url_for('edit'))
@@ -330,6 +378,123 @@ def pick_table():
     return render_template('pick_table.html', table=table_html, table_name=table_name, options=options, operation=operation)
 
 
+def searchable_tables():
+    '''
+    Return
+    res: Names of the SEARCH_TABLES the logged in user may see in the global search
+    '''
+    return accessible_tables(session.get('authority'), list(SEARCH_TABLES))
+
+
+@app.route('/api/search')
+@login_required
+def api_search():
+    # Ranked hits across all inventory categories the user may see
+    query = request.args.get('q', '')
+    limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+    start = time.perf_counter()
+    hits = search_index.search(mysql, query, tables=searchable_tables(), limit=limit)
+    return jsonify({'query': query, 'hits': hits, 'took_ms': round((time.perf_counter() - start) * 1000, 3)})
+
+
+@app.route('/api/suggest')
+@login_required
+def api_suggest():
+    # Typeahead for the search box of the nav bar
+    prefix = request.args.get('q', '')
+    limit = max(1, min(request.args.get('limit', 10, type=int), 50))
+    return jsonify({'query': prefix, 'suggestions': search_index.suggest(mysql, prefix, tables=searchable_tables(), limit=limit)})
+
+
+@app.route('/search')
+@login_required
+def search():
+    query = request.args.get('q', '')
+    hits = search_index.search(mysql, query, tables=searchable_tables(), limit=50)
+    return render_template('search.html', query=query, hits=hits)
+
+
+def warm_search_index():
+    '''
+    Builds the global search index in the background, so the first search does not pay for it
+    '''
+    try:
+        with app.app_context():
+            search_index.build(mysql)
+    except Exception as e:
+        app.logger.warning("Could not build the search index: %s", e)
+
+
+def table_page(table_name, stream=False):
+    '''
+    Renders the page of table_name selected by the sort/after/page_size query arguments
+    stream: if True the table is returned as a generator of html chunks (see iter_html_table)
+
+    Return
+    table: html table with action buttons for the rows of the page
+    pager: dict with the sort column, the next page token and the row count estimate
+    '''
+    page_size = request.args.get('page_size', app.config['EDIT_PAGE_SIZE'], type=int)
+    page_size = max(1, min(page_size, 500))
+    sort_col = request.args.get('sort')
+    after = request.args.get('after')
+
+    cacheable = table_name.lower() in app.config['FRAGMENT_CACHE_TABLES']
+    if cacheable:
+        key = fragments.key(table_name, session.get('authority'), sort_col, after, page_size)
+        hit = fragments.get(key)
+        if hit is not None:
+            html, pager = hit
+            return (iter([html]) if stream else html), pager
+
+    rows, next_after, total = select_page(mysql, table_name, page_size=page_size, sort_col=sort_col, after=after)
+    key_indexes = [rows.index(key) for key in catalog.primary_key_columns(mysql, table_name)]
+    pager = {
+        'sort': sort_col,
+        'page_size': page_size,
+        'after': after,
+        'next_after': next_after,
+        'shown': len(rows),
+        'total': total,
+    }
+    if stream:
+        chunks = iter_html_table(rows, buttons=True, key_indexes=key_indexes)
+        if cacheable:
+            chunks = fragments.cached_chunks(key, chunks, pager)
+        return chunks, pager
+    html = nested_list_to_html_table(rows, buttons=True, key_indexes=key_indexes)
+    if cacheable:
+        fragments.put(key, html, pager)
+    return html, pager
+
+
+def stream_page(template_name, **context):
+    '''
+    Renders a template as a streamed response, so the browser receives the start of the page
+    while the rest (e.g. the rows of a large table) is still being rendered
+    '''
+    app.update_template_context(context)
+    stream = app.jinja_env.get_template(template_name).stream(context)
+    stream.enable_buffering(8)
+    return app.response_class(stream_with_context(stream), mimetype='text/html')
+
+
+def form_values(table_name):
+    '''
+    Reads the value of every column of table_name from the posted insert/update form.
+    Empty fields of nullable columns become NULL.
+
+    Return
+    values: Dictionary mapping column names to values, in table order
+    '''
+    nullable = catalog.nullable(mysql, table_name)
+    values = {}
+    for col in catalog.columns(mysql, table_name):
+        val = request.form.get(col, '')
+        values[col] = None if val == '' and col in nullable else val
+    return values
+
+
 @app.route('/edit', methods=['POST', 'GET'])
 def edit():
     # Check if user is logged in
@@ -342,19 +507,7 @@ def edit():
         
     # Check permissions based on role
     authority = session.get('authority')
-    
-    # Define accessible tables for each role (case-insensitive matching)
-    accessible_tables = {
-        'Admin': None,  # None means all tables - Admin has full access
-        'Staff': ["equipment", "lab_visits", "maintenance_visits", "consumable_inventory", "software", "vendors"],  # Staff has view-only access to these tables
-        'Visitor': ["equipment", "consumable_inventory", "software", "maintenance_visits"]
-    }
-    
-    # Check access permissions
-    if authority == 'Visitor' and table_name.lower() not in accessible_tables['Visitor']:
-        return render_template('error.html', error="You do not have permission to access this table")
-    
-    if authority == 'Staff' and table_name.lower() not in accessible_tables['Staff']:
+    if not can_access_table(authority, table_name):
         return render_template('error.html', error="You do not have permission to access this table")
     
     operation = None
@@ -374,17 +527,10 @@ def edit():
     # Admin-only operations (DELETE)
     if authority == 'Admin':
         if request.method == 'POST' and 'delete_button' in request.form:
-            values = request.form['delete_button'].split(',')
-            values = [val if val.isnumeric() else "\'" + val + "\'" for val in values]
-            columns = select_with_headers(mysql, table_name)[0]
-            where = []
-            for col, val in zip(columns, values):
-                where.append(col + " = " + val)
-            where = " AND ".join(where)
-            tables = delete_from_table(mysql, table_name, where)
             try:
-                tables = [nested_list_to_html_table(t) for t in tables]
-                return render_template('delete_results.html', tables=tables, table_name=table_name)
+                change = delete_from_table(mysql, table_name, decode_row_key(request.form['delete_button']))
+                diff = change_set_to_html_table(change)
+                return render_template('delete_results.html', diff=diff, change=change, table_name=table_name)
             except Exception as e:
                 return render_template('invalid.html', e=str(e))
 
@@ -392,91 +538,129 @@ def edit():
     if authority == 'Admin':
         if request.method == 'POST' and 'insert_form' in request.form:
             operation = 'insert'
-            table = nested_list_to_html_table(select_with_headers(mysql, table_name), buttons=True)
-            form_html = get_insert_form(select_with_headers(mysql, table_name)[0])
+            table, pager = table_page(table_name)
+            form_html = get_insert_form(catalog.columns(mysql, table_name), catalog.nullable(mysql, table_name))
             return render_template('edit.html', table=table, table_name=table_name, operation=operation,
-                                   form_html=form_html)
+                                   form_html=form_html, pager=pager, options=options)
         elif request.method == 'POST' and 'insert_execute' in request.form:
-            columns = select_with_headers(mysql, table_name)[0]
-            values = []
-            for col in columns:
-                val = request.form[col]
-                if val.isnumeric():
-                    values.append(val)
-                else:
-                    values.append("\'" + val + "\'")
+            values = form_values(table_name)
             try:
-                tables = insert_to_table(mysql, table_name, columns, values)
+                change = insert_to_table(mysql, table_name, list(values.keys()), list(values.values()))
             except Exception as e:
                 return render_template('invalid.html', e=str(e))
-            tables = [nested_list_to_html_table(t) for t in tables]
-            return render_template('insert_results.html', tables=tables, table_name=table_name)
+            diff = change_set_to_html_table(change)
+            return render_template('insert_results.html', diff=diff, change=change, table_name=table_name)
 
         elif request.method == 'POST' and 'update_button' in request.form:
             operation = 'update'
-            table = nested_list_to_html_table(select_with_headers(mysql, table_name), buttons=True)
-            values = request.form['update_button'].split(',')
-            form_html = get_update_form(select_with_headers(mysql, table_name)[0], values)
-            values = [val if val.isnumeric() else "\'" + val + "\'" for val in values]
-            columns = select_with_headers(mysql, table_name)[0]
-            where = []
-            for col, val in zip(columns, values):
-                where.append(col + " = " + val)
-            where = " AND ".join(where)
-            session['update_where'] = where
+            table, pager = table_page(table_name)
+            key_values = decode_row_key(request.form['update_button'])
+            try:
+                columns, row = select_row(mysql, table_name, key_values)
+            except ValueError as e:
+                return render_template('invalid.html', e=str(e))
+            if row is None:
+                msg = 'This row no longer exists!'
+                return render_template('edit.html', table=table, table_name=table_name, msg=msg,
+                                       pager=pager, options=options)
+            form_html = get_update_form(columns, row, catalog.nullable(mysql, table_name))
+            session['update_key'] = key_values
             return render_template('edit.html', table=table, table_name=table_name, operation=operation,
-                                   form_html=form_html)
+                                   form_html=form_html, pager=pager, options=options)
         elif request.method == 'POST' and 'update_execute' in request.form:
-            columns = select_with_headers(mysql, table_name)[0]
-            values = []
-            for col in columns:
-                val = request.form[col]
-                if val.isnumeric():
-                    values.append(val)
-                else:
-                    values.append("\'" + val + "\'")
-
-            set_statement = []
-            for col, val in zip(columns, values):
-                set_statement.append(col + " = " + val)
-            set_statement = ", ".join(set_statement)
-
+            values = form_values(table_name)
             try:
-                tables = update_table(mysql, table_name, set_statement, session['update_where'])
+                change = update_table(mysql, table_name, values, session['update_key'])
             except Exception as e:
                 return render_template('invalid.html', e=str(e))
-            tables = [nested_list_to_html_table(t) for t in tables]
-            if session.get('update_where'):
-                session.pop('update_where', None)
-            return render_template('update_results.html', tables=tables, table_name=table_name)
+            diff = change_set_to_html_table(change)
+            if session.get('update_key'):
+                session.pop('update_key', None)
+            return render_template('update_results.html', diff=diff, change=change, table_name=table_name)
 
     # All users can search operations
     if request.method == 'POST' and 'search_form' in request.form:
         operation = 'search'
-        table = nested_list_to_html_table(select_with_headers(mysql, table_name), buttons=True)
+        table, pager = table_page(table_name)
         return render_template('edit.html', table=table, table_name=table_name, operation=operation,
-                               options=options)
-    elif request.method == 'POST' and 'search_execute' in request.form:
-        search_col = request.form['column']
-        search_word = request.form['search_word']
+                               options=options, pager=pager)
+    elif (request.method == 'POST' and 'search_execute' in request.form) or request.args.get('q'):
+        # The first page is posted from the search form, the next ones are links carrying column/q/page
+        search_col = request.values.get('column', '')
+        search_word = request.form.get('search_word') or request.args.get('q', '')
+        page = request.args.get('page', 1, type=int)
+        page_size = request.args.get('page_size', app.config['EDIT_PAGE_SIZE'], type=int)
+        page_size = max(1, min(page_size, 500))
 
-        # search table
-        cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
-        cursor.execute(
-            f"DROP VIEW IF EXISTS Search_Result; CREATE VIEW Search_Result AS SELECT * FROM {table_name} WHERE {search_col} LIKE '%{search_word}%'")
-        result_table = cursor.fetchall()
-        cursor.nextset()
-        mysql.connection.commit()
         try:
-            table_name = 'Search_Result'
-            table = nested_list_to_html_table(select_with_headers(mysql, table_name), buttons=True)
-            return render_template('search_result.html', table=table, table_name=table_name)
+            rows, has_more, mode = search_page(mysql, table_name, search_col, search_word,
+                                               page_size=page_size, page=page)
         except Exception as e:
             return render_template('invalid.html', e=str(e))
+        key_indexes = [rows.index(key) for key in catalog.primary_key_columns(mysql, table_name)]
+        table = nested_list_to_html_table(rows, buttons=True, key_indexes=key_indexes)
+        pager = {
+            'search': {'column': search_col, 'q': search_word, 'mode': mode},
+            'page': max(1, page),
+            'page_size': page_size,
+            'has_more': has_more,
+            'shown': len(rows),
+        }
+        return render_template('edit.html', table=table, table_name=table_name, msg=msg,
+                               pager=pager, options=options)
+
+    table_chunks, pager = table_page(table_name, stream=True)
+    return stream_page('edit.html', table_chunks=table_chunks, table_name=table_name, operation=operation,
+                       form_html=form_html, msg=msg, pager=pager, options=options)
+
+
+def read_import_file(upload):
+    '''
+    Lazily reads the records of an uploaded CSV or JSON Lines file
+
+    Return
+    Generator of (line number, record dictionary), or (line number, ValueError) for unreadable lines
+    '''
+    stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+    if upload.filename.lower().endswith(('.jsonl', '.json')):
+        for line_no, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                record = ValueError(f"invalid JSON ({e})")
+            if not isinstance(record, (dict, ValueError)):
+                record = ValueError("expected a JSON object")
+            yield line_no, record
+    else:
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record
+
+
+@app.route('/import_table', methods=['POST'])
+@login_required
+def import_table():
+    table_name = session.get('table_name')
+    if not table_name:
+        return redirect(url_for('pick_table'))
+
+    # Only Admin can insert records
+    if session.get('authority') != 'Admin':
+        return render_template('error.html', error="Only administrators can import records")
+
+    upload = request.files.get('import_file')
+    if not upload or not upload.filename:
+        return render_template('error.html', error="Please choose a CSV or JSON Lines file to import")
 
-    table = nested_list_to_html_table(select_with_headers(mysql, table_name), buttons=True)
-    return render_template('edit.html', table=table, table_name=table_name, operation=operation, form_html=form_html,
-                           msg=msg)
+    try:
+        inserted, errors = bulk_insert(mysql, table_name, read_import_file(upload),
+                                       chunk_size=app.config['IMPORT_CHUNK_SIZE'])
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        return render_template('invalid.html', e=str(e))
+
+    return render_template('import_results.html', table_name=table_name, inserted=inserted, errors=errors)
 
 
 # Add routes for direct category access
@@ -494,49 +678,53 @@ def consumables():
     session['table_name'] = 'consumable_inventory'
     return redirect(url_for('edit'))
 
-@app.route('/software')
-@login_required
-def software():
+# Software catalog shared by all users: (Software table version, time read, rows)
+software_catalog_cache = None
+
+def software_catalog():
+    '''
+    Reads the software catalog, the part of /software that is the same for every user.
+    It is cached until the Software table version changes (see license_pools_changed) or
+    it is older than the fragment cache max_age.
+
+    Return
+    res: ResultSet of the software with their vendor name, ordered by name
+    '''
+    global software_catalog_cache
+    version = fragments.version('Software')
+    cached = software_catalog_cache
+    if cached is not None and cached[0] == version and time.monotonic() - cached[1] <= fragments.max_age:
+        return cached[2]
+
     cursor = mysql.connection.cursor()
-    
-    # Get software with license information and user's checkout status
     cursor.execute('''
         SELECT s.software_id, s.software_name, s.version, s.description, s.platform,
                s.supported_by, s.installed_location, s.total_seats, s.used_seats,
-               s.license_model, v.vendor_name AS vendor_name,
-               (SELECT COUNT(*) FROM LicenseUsage 
-                WHERE software_id = s.software_id AND user_id = %s) AS has_checkout
+               s.license_model, v.vendor_name AS vendor_name
         FROM Software s
         LEFT JOIN Vendors v ON s.vendor_id = v.vendor_id
         ORDER BY s.software_name
-    ''', (session['id'],))
-    
-    software_list = cursor.fetchall()
+    ''')
+    rows = fetch_all(cursor)
     cursor.close()
-    
-    return render_template('software.html', 
-                          software=software_list, 
-                          title='Software')
+    software_catalog_cache = (version, time.monotonic(), rows)
+    return rows
 
-@app.route('/software_detail')
+@app.route('/software')
+@app.route('/software_detail', endpoint='software_detail')
 @login_required
-def software_detail():
+def software():
     cursor = mysql.connection.cursor()
     
-    # Get software with license information and user's checkout status
-    cursor.execute('''
-        SELECT s.software_id, s.software_name, s.version, s.description, s.platform,
-               s.supported_by, s.installed_location, s.total_seats, s.used_seats,
-               s.license_model, v.vendor_name AS vendor_name,
-               (SELECT COUNT(*) FROM LicenseUsage 
-                WHERE software_id = s.software_id AND user_id = %s) AS has_checkout
-        FROM Software s
-        LEFT JOIN Vendors v ON s.vendor_id = v.vendor_id
-        ORDER BY s.software_name
-    ''', (session['id'],))
-    
-    software_list = cursor.fetchall()
+    # The user's checkouts are read once and merged into the shared catalog
+    cursor.execute('SELECT DISTINCT software_id FROM LicenseUsage WHERE user_id = %s', (session['id'],))
+    checked_out = {row[0] for row in cursor.fetchall()}
     cursor.close()
+
+    catalog_rows = software_catalog()
+    id_pos = catalog_rows.index('software_id')
+    software_list = ResultSet(catalog_rows.header + ('has_checkout',),
+                              [row + (int(row[id_pos] in checked_out),) for row in catalog_rows.rows])
     
     return render_template('software.html', 
                           software=software_list, 
@@ -547,22 +735,41 @@ def software_detail():
 def maintenance():
     # Check if user has permission to access this page
     authority = session.get('authority')
-    
-    # Define accessible tables for each role (case-insensitive matching)
-    accessible_tables = {
-        'Admin': None,  # None means all tables - Admin has full access
-        'Staff': ["equipment", "lab_visits", "maintenance_visits", "consumable_inventory", "software", "vendors"],  # Staff has view-only access to these tables
-        'Visitor': ["equipment", "consumable_inventory", "software", "maintenance_visits"]
-    }
-    
-    # Check if current user role can access maintenance_visits
-    if authority == 'Visitor' and 'maintenance_visits' not in accessible_tables['Visitor']:
+    if not can_access_table(authority, 'maintenance_visits'):
         return render_template('error.html', error="You do not have permission to access this page")
     
     # Set the table name in session
     session['table_name'] = 'maintenance_visits'
     return redirect(url_for('edit'))
 
+def license_pools_changed():
+    '''
+    Invalidates the cached pages of the tables changed by license checkouts and returns
+    '''
+    fragments.bump('Software')
+    fragments.bump('LicensePool')
+
+def reconcile_license_seats():
+    '''
+    Background job recomputing the available seats of every pool from LicenseUsage, every
+    LICENSE_RECONCILE_INTERVAL seconds. Checkouts and checkins adjust the seat counts
+    incrementally; this catches any drift (usage rows removed by the license server,
+    manual edits...).
+    '''
+    interval = app.config['LICENSE_RECONCILE_INTERVAL']
+    while True:
+        time.sleep(interval)
+        try:
+            with mysql.pool.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('SELECT update_license_available_seats()')
+                cursor.fetchall()
+                conn.commit()
+                cursor.close()
+            license_pools_changed()
+        except Exception as e:
+            app.logger.warning("License seat reconciliation failed: %s", e)
+
 # License Management Routes
 @app.route('/licenses')
 @login_required
@@ -582,7 +789,7 @@ def licenses():
         LEFT JOIN Vendors v ON s.vendor_id = v.vendor_id
         ORDER BY s.software_name
     ''')
-    software_licenses = cursor.fetchall()
+    software_licenses = fetch_all(cursor)
     
     # Get license pools
     cursor.execute('''
@@ -594,7 +801,7 @@ def licenses():
         LEFT JOIN Vendors v ON lp.vendor_id = v.vendor_id
         ORDER BY s.software_name
     ''')
-    license_pools = cursor.fetchall()
+    license_pools = fetch_all(cursor)
     
     cursor.close()
     return render_template('licenses.html', 
@@ -605,7 +812,7 @@ def licenses():
 @app.route('/license_return')
 @login_required
 def license_return():
-    cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+    cursor = mysql.connection.cursor()
     
     # Get all active licenses for the current user
     cursor.execute('''
@@ -620,7 +827,7 @@ def license_return():
         ORDER BY lu.checkout_time DESC
     ''', (session['id'],))
     
-    active_licenses = cursor.fetchall()
+    active_licenses = fetch_all(cursor)
     cursor.close()
     
     return render_template('license_return.html', 
@@ -638,40 +845,32 @@ def return_license():
         notes = request.form['notes']
         confirm_uninstall = 'confirm_uninstall' in request.form
         
-        cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+        cursor = mysql.connection.cursor()
         
         # Get license details
         cursor.execute('''
-            SELECT lu.id, lu.software_id, lu.session_id
+            SELECT lu.id, lu.software_id, lu.pool_id, lu.session_id
             FROM LicenseUsage lu
             WHERE lu.id = %s AND lu.user_id = %s
         ''', (license_id, session['id']))
         
-        license_details = cursor.fetchone()
+        license_details = fetch_row(cursor)
         
         if license_details:
             # Only admin can delete records, staff only view
             if authority == 'Admin':
-                # Delete the usage record
+                # Delete the usage record and give its seat back
                 cursor.execute('DELETE FROM LicenseUsage WHERE id = %s', (license_id,))
+                if cursor.rowcount:
+                    release_seat(cursor, license_details['software_id'], license_details['pool_id'])
                 
                 # Log the return with details
                 details = f"Return reason: {return_reason}. Notes: {notes}. Uninstall confirmed: {confirm_uninstall}"
-                cursor.execute('''
-                    INSERT INTO LicenseAudit 
-                    (software_id, user_id, action, ip_address, session_id, details)
-                    VALUES (%s, %s, %s, %s, %s, %s)
-                ''', (license_details['software_id'], 
-                      session['id'], 
-                      'checkin', 
-                      request.remote_addr, 
-                      license_details['session_id'], 
-                      details))
-                
-                # Update available seats
-                cursor.execute('SELECT update_license_available_seats()')
+                log_license_action(cursor, license_details['software_id'], session['id'], 'checkin',
+                                   request.remote_addr, details, license_details['session_id'])
                 
                 mysql.connection.commit()
+                license_pools_changed()
                 flash('License returned successfully!', 'success')
             else:
                 flash('You have view-only access. Contact an administrator to return licenses.', 'warning')
@@ -691,7 +890,7 @@ def renew_license():
         duration = int(request.form['duration'])
         reason = request.form['reason']
         
-        cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+        cursor = mysql.connection.cursor()
         
         if authority == 'Admin':
             # Update license expiration by extending the expected_checkin date
@@ -706,19 +905,12 @@ def renew_license():
                 cursor.execute('''
                     SELECT software_id, session_id FROM LicenseUsage WHERE id = %s
                 ''', (license_id,))
-                license_info = cursor.fetchone()
+                license_info = fetch_row(cursor)
                 
                 if license_info:
-                    cursor.execute('''
-                        INSERT INTO LicenseAudit 
-                        (software_id, user_id, action, ip_address, session_id, details)
-                        VALUES (%s, %s, %s, %s, %s, %s)
-                    ''', (license_info['software_id'], 
-                          session['id'], 
-                          'renew', 
-                          request.remote_addr, 
-                          license_info['session_id'], 
-                          f"Renewed for {duration} days. Reason: {reason}"))
+                    log_license_action(cursor, license_info['software_id'], session['id'], 'renew',
+                                       request.remote_addr, f"Renewed for {duration} days. Reason: {reason}",
+                                       license_info['session_id'])
                 
                 mysql.connection.commit()
                 flash('License renewed successfully!', 'success')
@@ -730,6 +922,16 @@ def renew_license():
         cursor.close()
         return redirect(url_for('license_return'))
 
+def parse_date(value):
+    '''
+    Return
+    res: The date of a YYYY-MM-DD string, or None if it is empty or invalid
+    '''
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        return None
+
 @app.route('/license_usage')
 @login_required
 def license_usage():
@@ -737,37 +939,77 @@ def license_usage():
     authority = session.get('authority')
     if authority not in ['Admin', 'Staff']:
         return render_template('error.html', error="You do not have permission to access this page")
-        
-    cursor = mysql.connection.cursor()
-    
-    # Get current license usage
-    cursor.execute('''
-        SELECT lu.id, s.software_name as software_name, s.version, u.name as user_name, 
-               u.email, lu.checkout_time, lu.last_heartbeat, 
+
+    page_size = max(1, min(request.args.get('page_size', 50, type=int), 500))
+    filters = {
+        'software_id': request.args.get('software_id', ''),
+        'user': request.args.get('user', ''),
+        'action': request.args.get('action', ''),
+        'date_from': request.args.get('date_from', ''),
+        'date_to': request.args.get('date_to', ''),
+    }
+
+    # Software and user filters apply to both lists, the others to the audit history only
+    usage_conditions, usage_params = [], []
+    audit_conditions, audit_params = [], []
+    if filters['software_id']:
+        usage_conditions.append('lu.software_id = %s')
+        usage_params.append(filters['software_id'])
+        audit_conditions.append('la.software_id = %s')
+        audit_params.append(filters['software_id'])
+    if filters['user']:
+        usage_conditions.append('lu.user_id IN (SELECT id FROM Users WHERE name = %s)')
+        usage_params.append(filters['user'])
+        audit_conditions.append('la.user_id IN (SELECT id FROM Users WHERE name = %s)')
+        audit_params.append(filters['user'])
+    if filters['action']:
+        audit_conditions.append('la.action = %s')
+        audit_params.append(filters['action'])
+    date_from, date_to = parse_date(filters['date_from']), parse_date(filters['date_to'])
+    if date_from:
+        audit_conditions.append('la.action_time >= %s')
+        audit_params.append(date_from)
+    if date_to:
+        audit_conditions.append('la.action_time < %s + INTERVAL 1 DAY')
+        audit_params.append(date_to)
+
+    # Current license usage, newest first, one page at a time
+    active_usage, usage_next = select_keyset(mysql, '''
+        SELECT lu.id, lu.software_id, lu.user_id, s.software_name as software_name, s.version,
+               u.name as user_name, u.email, lu.checkout_time, lu.last_heartbeat,
                lu.ip_address, lu.host_name, lu.checkout_location
         FROM LicenseUsage lu
         JOIN Software s ON lu.software_id = s.software_id
         JOIN Users u ON lu.user_id = u.id
-        ORDER BY lu.checkout_time DESC
-    ''')
-    active_usage = cursor.fetchall()
-    
-    # Get recent license audit history
-    cursor.execute('''
+    ''', usage_conditions, usage_params, ['lu.checkout_time', 'lu.id'],
+        page_size=page_size, after=request.args.get('usage_after'), descending=True)
+
+    # License audit history, newest first, one page at a time
+    audit_history, audit_next = select_keyset(mysql, '''
         SELECT la.id, s.software_name as software_name, u.name as user_name, 
                la.action, la.action_time, la.ip_address, la.details
         FROM LicenseAudit la
         JOIN Software s ON la.software_id = s.software_id
         JOIN Users u ON la.user_id = u.id
-        ORDER BY la.action_time DESC
-        LIMIT 100
-    ''')
-    audit_history = cursor.fetchall()
-    
-    cursor.close()
+    ''', audit_conditions, audit_params, ['la.action_time', 'la.id'],
+        page_size=page_size, after=request.args.get('audit_after'), descending=True)
+
+    # Links keep the filters and the position in the other list
+    args = {k: v for k, v in filters.items() if v}
+    args['page_size'] = page_size
+    pager = {
+        'usage_after': request.args.get('usage_after'),
+        'usage_next': usage_next,
+        'audit_after': request.args.get('audit_after'),
+        'audit_next': audit_next,
+        'args': args,
+    }
     return render_template('license_usage.html', 
                           active_usage=active_usage,
                           audit_history=audit_history,
+                          software_list=software_catalog(),
+                          filters=filters,
+                          pager=pager,
                           title='License Usage')
 
 @app.route('/license_rules')
@@ -789,11 +1031,11 @@ def license_rules():
         LEFT JOIN Users u ON lr.created_by = u.id
         ORDER BY s.software_name, lr.priority
     ''')
-    rules = cursor.fetchall()
+    rules = fetch_all(cursor)
     
     # Get all software for the form
     cursor.execute('SELECT software_id, software_name, version FROM Software ORDER BY software_name')
-    software_list = cursor.fetchall()
+    software_list = fetch_all(cursor)
     
     cursor.close()
     return render_template('license_rules.html', 
@@ -844,7 +1086,7 @@ def user_groups():
         GROUP BY ug.id
         ORDER BY ug.group_name
     ''')
-    groups = cursor.fetchall()
+    groups = fetch_all(cursor)
     
     cursor.close()
     return render_template('user_groups.html', 
@@ -858,7 +1100,7 @@ def group_members(group_id):
     
     # Get group details
     cursor.execute('SELECT id, group_name, description FROM UserGroups WHERE id = %s', (group_id,))
-    group = cursor.fetchone()
+    group = fetch_row(cursor)
     
     # Get group members
     cursor.execute('''
@@ -870,7 +1112,7 @@ def group_members(group_id):
         WHERE ugm.group_id = %s
         ORDER BY u.name
     ''', (group_id,))
-    members = cursor.fetchall()
+    members = fetch_all(cursor)
     
     # Get users not in the group for the form
     cursor.execute('''
@@ -881,7 +1123,7 @@ def group_members(group_id):
         )
         ORDER BY name
     ''', (group_id,))
-    available_users = cursor.fetchall()
+    available_users = fetch_all(cursor)
     
     cursor.close()
     return render_template('group_members.html', 
@@ -906,6 +1148,7 @@ def add_group_member():
         
         mysql.connection.commit()
         cursor.close()
+        software_access_cache.invalidate_user(user_id)
         
         flash('User added to group successfully!', 'success')
         return redirect(url_for('group_members', group_id=group_id))
@@ -921,6 +1164,7 @@ def remove_group_member(group_id, user_id):
     
     mysql.connection.commit()
     cursor.close()
+    software_access_cache.invalidate_user(user_id)
     
     flash('User removed from group successfully!', 'success')
     return redirect(url_for('group_members', group_id=group_id))
@@ -932,7 +1176,7 @@ def software_access(software_id):
     
     # Get software details
     cursor.execute('SELECT software_id, software_name, version FROM Software WHERE software_id = %s', (software_id,))
-    software = cursor.fetchone()
+    software = fetch_row(cursor)
     
     # Get groups with access
     cursor.execute('''
@@ -944,7 +1188,7 @@ def software_access(software_id):
         WHERE sga.software_id = %s
         ORDER BY ug.group_name
     ''', (software_id,))
-    access_groups = cursor.fetchall()
+    access_groups = fetch_all(cursor)
     
     # Get groups without access for the form
     cursor.execute('''
@@ -955,7 +1199,7 @@ def software_access(software_id):
         )
         ORDER BY group_name
     ''', (software_id,))
-    available_groups = cursor.fetchall()
+    available_groups = fetch_all(cursor)
     
     cursor.close()
     return render_template('software_access.html', 
@@ -981,6 +1225,7 @@ def add_software_access():
         
         mysql.connection.commit()
         cursor.close()
+        software_access_cache.invalidate_all()
         
         flash('Group access added successfully!', 'success')
         return redirect(url_for('software_access', software_id=software_id))
@@ -996,6 +1241,7 @@ def remove_software_access(software_id, group_id):
     
     mysql.connection.commit()
     cursor.close()
+    software_access_cache.invalidate_all()
     
     flash('Group access removed successfully!', 'success')
     return redirect(url_for('software_access', software_id=software_id))
@@ -1009,97 +1255,22 @@ def checkout_license(software_id):
         flash('You have view-only access. Contact an administrator to check out licenses.', 'warning')
         return redirect(url_for('software'))
         
-    cursor = mysql.connection.cursor()
-    
-    # Check if there are available licenses
-    cursor.execute('''
-        SELECT s.software_id, s.software_name, lp.available_seats, lp.license_model
-        FROM Software s
-        JOIN LicensePool lp ON s.software_id = lp.software_id
-        WHERE s.software_id = %s AND lp.available_seats > 0
-    ''', (software_id,))
-    license_info = cursor.fetchone()
-    
-    if not license_info:
-        # Log the denial
-        cursor.execute('''
-            INSERT INTO LicenseAudit 
-            (software_id, user_id, action, ip_address, details)
-            VALUES (%s, %s, %s, %s, %s)
-        ''', (software_id, session['id'], 'deny', request.remote_addr, 'No licenses available'))
-        
-        mysql.connection.commit()
-        cursor.close()
+    # Group access comes from the in-memory cache, the rest is one transaction with the pool row
+    # locked (see license_tools.checkout_license_seat)
+    has_access = software_access_cache.can_use_software(mysql, session['id'], software_id)
+    host_name = request.headers.get('Host', 'unknown')
+    status, software_name, _ = checkout_license_seat(mysql, software_id, session['id'], request.remote_addr,
+                                                     host_name, has_access)
+
+    if status == NO_SEATS:
         flash('No licenses available for this software!', 'danger')
-        return redirect(url_for('software'))
-    
-    # Check if user has permission
-    cursor.execute('''
-        SELECT COUNT(*) as has_access
-        FROM UserGroupMembers ugm
-        JOIN SoftwareGroupAccess sga ON ugm.group_id = sga.group_id
-        WHERE ugm.user_id = %s AND sga.software_id = %s
-    ''', (session['id'], software_id))
-    access_check = cursor.fetchone()
-    
-    if not access_check or access_check['has_access'] == 0:
-        # Log the denial
-        cursor.execute('''
-            INSERT INTO LicenseAudit 
-            (software_id, user_id, action, ip_address, details)
-            VALUES (%s, %s, %s, %s, %s)
-        ''', (software_id, session['id'], 'deny', request.remote_addr, 'User does not have permission'))
-        
-        mysql.connection.commit()
-        cursor.close()
+    elif status == NO_ACCESS:
         flash('You do not have permission to use this software!', 'danger')
-        return redirect(url_for('software'))
-    
-    # Check if user already has a license checked out
-    cursor.execute('''
-        SELECT id
-        FROM LicenseUsage
-        WHERE software_id = %s AND user_id = %s
-    ''', (software_id, session['id']))
-    existing_checkout = cursor.fetchone()
-    
-    if existing_checkout:
-        # Update the heartbeat
-        cursor.execute('''
-            UPDATE LicenseUsage
-            SET last_heartbeat = NOW()
-            WHERE id = %s
-        ''', (existing_checkout['id'],))
-        
-        mysql.connection.commit()
-        cursor.close()
+    elif status == ALREADY_CHECKED_OUT:
         flash('You already have a license for this software!', 'info')
-        return redirect(url_for('software'))
-    
-    # Create a new checkout
-    session_id = str(uuid.uuid4())
-    host_name = request.headers.get('Host', 'unknown')
-    
-    cursor.execute('''
-        INSERT INTO LicenseUsage 
-        (software_id, user_id, session_id, ip_address, host_name)
-        VALUES (%s, %s, %s, %s, %s)
-    ''', (software_id, session['id'], session_id, request.remote_addr, host_name))
-    
-    # Log the checkout
-    cursor.execute('''
-        INSERT INTO LicenseAudit 
-        (software_id, user_id, action, ip_address, session_id, details)
-        VALUES (%s, %s, %s, %s, %s, %s)
-    ''', (software_id, session['id'], 'checkout', request.remote_addr, session_id, 'License checked out'))
-    
-    # Update available seats
-    cursor.execute('SELECT update_license_available_seats()')
-    
-    mysql.connection.commit()
-    cursor.close()
-    
-    flash(f'License for {license_info["software_name"]} checked out successfully!', 'success')
+    else:
+        license_pools_changed()
+        flash(f'License for {software_name} checked out successfully!', 'success')
     return redirect(url_for('software'))
 
 @app.route('/checkin_license/<string:software_id>')
@@ -1115,32 +1286,29 @@ def checkin_license(software_id):
     
     # Get the checkout info
     cursor.execute('''
-        SELECT id, session_id
+        SELECT id, pool_id, session_id
         FROM LicenseUsage
         WHERE software_id = %s AND user_id = %s
     ''', (software_id, session['id']))
-    checkout = cursor.fetchone()
+    checkout = fetch_row(cursor)
     
     if not checkout:
         cursor.close()
         flash('You do not have a license checked out for this software!', 'danger')
         return redirect(url_for('software'))
     
-    # Delete the usage record
+    # Delete the usage record and give its seat back
     cursor.execute('DELETE FROM LicenseUsage WHERE id = %s', (checkout['id'],))
+    if cursor.rowcount:
+        release_seat(cursor, software_id, checkout['pool_id'])
     
     # Log the checkin
-    cursor.execute('''
-        INSERT INTO LicenseAudit 
-        (software_id, user_id, action, ip_address, session_id, details)
-        VALUES (%s, %s, %s, %s, %s, %s)
-    ''', (software_id, session['id'], 'checkin', request.remote_addr, checkout['session_id'], 'License checked in'))
-    
-    # Update available seats
-    cursor.execute('SELECT update_license_available_seats()')
+    log_license_action(cursor, software_id, session['id'], 'checkin', request.remote_addr,
+                       'License checked in', checkout['session_id'])
     
     mysql.connection.commit()
     cursor.close()
+    license_pools_changed()
     
     flash('License checked in successfully!', 'success')
     return redirect(url_for('software'))
@@ -1160,7 +1328,31 @@ def license_checkout():
 
 # app run
 
+_background_jobs_started = False
+
+def start_background_jobs(reconcile=True):
+    '''
+    Starts the background threads of the process: the license audit writer, warming the search index
+    and, unless LICENSE_RECONCILE_INTERVAL is 0, the license seat reconciliation. Does nothing when
+    called again. Not done on import, so scripts and tools importing the app start no threads (and
+    audit events are written synchronously); under a WSGI server, call it in every worker after the
+    fork (e.g. a post-fork hook), with reconcile=False in all but one so the seats are not reconciled
+    by every worker.
+    reconcile: whether to start the license seat reconciliation
+    '''
+    global _background_jobs_started
+    if _background_jobs_started:
+        return
+    _background_jobs_started = True
+    audit.start()
+    threading.Thread(target=warm_search_index, daemon=True).start()
+    if reconcile and app.config['LICENSE_RECONCILE_INTERVAL'] > 0:
+        threading.Thread(target=reconcile_license_seats, daemon=True).start()
+
 if __name__ == '__main__':
+    # The reloader runs this module twice: start the jobs only in the process that serves requests
+    if is_running_from_reloader():
+        start_background_jobs()
     app.run(debug=True, port=7000)
 
 # List of changes to be made to the program (by me)
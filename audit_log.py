@@ -0,0 +1,318 @@
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+import MySQLdb
+
+logger = logging.getLogger(__name__)
+
+AUDIT_COLUMNS = ('software_id', 'user_id', 'action', 'ip_address', 'session_id', 'details', 'action_time')
+
+# Errors meaning the rows themselves are refused (e.g. a foreign key to an unknown software), not that MySQL is
+# unavailable: retrying the same rows later would fail again
+REJECTED_ERRORS = (MySQLdb.IntegrityError, MySQLdb.DataError)
+
+
+class AuditSink:
+    '''
+    Write-behind sink for LicenseAudit rows.
+
+    Events are queued in memory and written by a background thread with multi-row INSERTs, as soon as
+    batch_size events are waiting or flush_interval seconds after the oldest one was queued. Each event
+    keeps the time it was logged as its action_time.
+
+    When the queue is full (MySQL is slow or down) or a flush fails, events are appended to a JSON Lines
+    spill file instead of being dropped; the spill file is replayed into LicenseAudit by the next
+    successful flush. The replay first moves the spill file aside (spill_path + '.replay') and inserts its
+    events without holding the spill lock, so requests spilling meanwhile never wait on the database.
+    Lines of the spill file that cannot be parsed (a write torn by a crash) are moved to spill_path + '.bad'.
+    Whatever is still queued is flushed when the process exits.
+
+    A batch refused by MySQL (REJECTED_ERRORS) is written again one row at a time, and the rows that are
+    still refused are logged and dropped, so one bad event cannot hold back the others.
+
+    In strict mode (or before init_app) events are written synchronously with the cursor of the caller,
+    in the same transaction as the change they describe.
+
+    connect: callable returning a context manager that yields a database connection (ConnectionPool.connection)
+    max_queue: events kept in memory before new ones go to the spill file
+    batch_size: events written per INSERT
+    flush_interval: maximum seconds an event waits in the queue
+    spill_path: JSON Lines file events are written to when they cannot go to the database
+    strict: if True every event is written synchronously
+    '''
+
+    def __init__(self, connect=None, max_queue=10000, batch_size=200, flush_interval=1.0,
+                 spill_path='license_audit_spill.jsonl', strict=False):
+        self.connect = connect
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spill_path = spill_path
+        self.strict = strict
+
+        self._cond = threading.Condition()
+        self._queue = deque()
+        self._spill_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._stopping = False
+
+        # Statistics, updated under _cond
+        self.logged = 0
+        self.written = 0
+        self.batches = 0
+        self.spilled = 0
+        self.replayed = 0
+        self.failures = 0
+        self.dropped = 0
+
+    def init_app(self, app, connect):
+        '''
+        Configures the sink from AUDIT_STRICT, AUDIT_QUEUE_SIZE, AUDIT_BATCH_SIZE, AUDIT_FLUSH_INTERVAL and
+        AUDIT_SPILL_FILE in the app config. The background writer is started by start(); until then
+        events are written synchronously
+        connect: see the class documentation
+        '''
+        config = app.config
+        self.connect = connect
+        self.strict = config.get('AUDIT_STRICT', self.strict)
+        self.max_queue = config.get('AUDIT_QUEUE_SIZE', self.max_queue)
+        self.batch_size = config.get('AUDIT_BATCH_SIZE', self.batch_size)
+        self.flush_interval = config.get('AUDIT_FLUSH_INTERVAL', self.flush_interval)
+        self.spill_path = config.get('AUDIT_SPILL_FILE', self.spill_path)
+
+    def start(self):
+        '''
+        Starts the background writer and registers the flush at exit (nothing to do in strict mode)
+        '''
+        if self._thread is not None or self.strict:
+            return
+        self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def log(self, cursor, software_id, user_id, action, ip_address, details, session_id=None):
+        '''
+        Records a LicenseAudit event
+        cursor: cursor of the caller's transaction, used in strict mode
+        action: 'checkout', 'checkin', 'deny', 'renew'...
+        '''
+        if self.strict or self._thread is None:
+            with self._cond:
+                self.logged += 1
+            cursor.execute('''
+                INSERT INTO LicenseAudit
+                (software_id, user_id, action, ip_address, session_id, details)
+                VALUES (%s, %s, %s, %s, %s, %s)
+            ''', (software_id, user_id, action, ip_address, session_id, details))
+            return
+
+        event = (software_id, user_id, action, ip_address, session_id, details,
+                 datetime.now().isoformat(sep=' ', timespec='microseconds'))
+        with self._cond:
+            self.logged += 1
+            if len(self._queue) < self.max_queue:
+                self._queue.append((time.monotonic(), event))
+                # The writer sleeps until the deadline of the oldest event, or for good while the queue is empty
+                if len(self._queue) == 1 or len(self._queue) >= self.batch_size:
+                    self._cond.notify()
+                return
+        # Queue full: keep the event on disk rather than block the request or lose it
+        self._spill([event])
+
+    def flush(self):
+        '''
+        Writes everything that is queued (and any spilled events) now
+        '''
+        with self._flush_lock:
+            while True:
+                batch = self._take(self.batch_size)
+                if not batch:
+                    break
+                self._write(batch)
+            self._replay()
+
+    def close(self):
+        '''
+        Stops the background writer and flushes what is left
+        '''
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval + 5)
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Could not flush the audit events at exit")
+
+    def stats(self):
+        '''
+        Return
+        res: Dictionary with the event counters and the current queue length
+        '''
+        with self._cond:
+            return {
+                'strict': self.strict,
+                'queued': len(self._queue),
+                'logged': self.logged,
+                'written': self.written,
+                'batches': self.batches,
+                'spilled': self.spilled,
+                'replayed': self.replayed,
+                'failures': self.failures,
+                'dropped': self.dropped,
+            }
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopping:
+                    if len(self._queue) >= self.batch_size:
+                        break
+                    if self._queue:
+                        wait = self.flush_interval - (time.monotonic() - self._queue[0][0])
+                        if wait <= 0:
+                            break
+                    else:
+                        wait = None
+                    self._cond.wait(wait)
+                if self._stopping:
+                    return
+            try:
+                self.flush()
+            except Exception:
+                # Keep the writer alive; what was not written is still queued or spilled
+                logger.exception("Audit flush failed")
+                time.sleep(self.flush_interval)
+
+    def _take(self, count):
+        with self._cond:
+            batch = []
+            while self._queue and len(batch) < count:
+                batch.append(self._queue.popleft()[1])
+            return batch
+
+    def _insert(self, events):
+        placeholders = ', '.join(['(' + ', '.join(['%s'] * len(AUDIT_COLUMNS)) + ')'] * len(events))
+        params = [value for event in events for value in event]
+        with self.connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"INSERT INTO LicenseAudit ({', '.join(AUDIT_COLUMNS)}) VALUES {placeholders}", params)
+            conn.commit()
+            cursor.close()
+
+    def _insert_checked(self, events):
+        '''
+        Inserts events with one INSERT, or one row at a time if MySQL refuses the batch (REJECTED_ERRORS);
+        rows refused on their own are dropped
+
+        Return
+        done: Number of leading events written or dropped
+        written: Number of events written
+        error: Exception that stopped the insert (the events after done are not written), or None
+        '''
+        try:
+            self._insert(events)
+            return len(events), len(events), None
+        except REJECTED_ERRORS as e:
+            refused = e
+        except Exception as e:
+            return 0, 0, e
+        if len(events) == 1:
+            self._drop(events[0], refused)
+            return 1, 0, None
+        written = 0
+        for done, event in enumerate(events):
+            try:
+                self._insert([event])
+                written += 1
+            except REJECTED_ERRORS as e:
+                self._drop(event, e)
+            except Exception as e:
+                return done, written, e
+        return len(events), written, None
+
+    def _drop(self, event, error):
+        logger.error("Dropping audit event %s refused by MySQL: %s", event, error)
+        with self._cond:
+            self.dropped += 1
+
+    def _write(self, batch):
+        done, written, error = self._insert_checked(batch)
+        with self._cond:
+            self.written += written
+            self.batches += 1 if written else 0
+        if error is not None:
+            with self._cond:
+                self.failures += 1
+            logger.warning("Could not write %d audit events, spilling them to %s: %s",
+                           len(batch) - done, self.spill_path, error)
+            self._spill(batch[done:])
+            return False
+        return True
+
+    def _spill(self, events):
+        with self._spill_lock:
+            with open(self.spill_path, 'a', encoding='utf-8') as f:
+                for event in events:
+                    f.write(json.dumps(event) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+        with self._cond:
+            self.spilled += len(events)
+
+    def _replay(self):
+        # Only called with _flush_lock held, so the .replay file has a single reader and writer.
+        # A .replay file left by a failed replay is retried before the spill file is moved again.
+        replay_path = self.spill_path + '.replay'
+        with self._spill_lock:
+            if not os.path.exists(replay_path):
+                if not os.path.exists(self.spill_path) or os.path.getsize(self.spill_path) == 0:
+                    return
+                os.replace(self.spill_path, replay_path)
+        events = []
+        bad = []
+        with open(replay_path, encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    event = tuple(json.loads(line))
+                except (ValueError, TypeError):
+                    bad.append(line.rstrip('\n'))
+                    continue
+                if len(event) == len(AUDIT_COLUMNS):
+                    events.append(event)
+                else:
+                    bad.append(line.rstrip('\n'))
+        if bad:
+            # Torn by a crash in the middle of a write: kept aside for inspection, never replayed
+            logger.error("Moving %d unreadable lines of the audit spill file to %s.bad", len(bad), self.spill_path)
+            with open(self.spill_path + '.bad', 'a', encoding='utf-8') as f:
+                for line in bad:
+                    f.write(line + '\n')
+        for i in range(0, len(events), self.batch_size):
+            batch = events[i:i + self.batch_size]
+            done, written, error = self._insert_checked(batch)
+            with self._cond:
+                self.replayed += written
+            if error is not None:
+                # Keep the events that were not written for the next attempt
+                logger.warning("Could not replay the audit spill file %s: %s", replay_path, error)
+                with open(replay_path, 'w', encoding='utf-8') as f:
+                    for event in events[i + done:]:
+                        f.write(json.dumps(event) + '\n')
+                    f.flush()
+                    os.fsync(f.fileno())
+                return
+        os.remove(replay_path)
+
+# Shared by all requests of the process, configured by init_app
+audit = AuditSink()
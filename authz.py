@@ -0,0 +1,113 @@
+import threading
+import time
+
+# Tables each role may open (lower case). None means every table.
+ROLE_TABLES = {
+    'Admin': None,
+    # Staff has view-only access to these tables
+    'Staff': frozenset(["equipment", "lab_visits", "maintenance_visits", "consumable_inventory", "software", "vendors"]),
+    'Visitor': frozenset(["equipment", "consumable_inventory", "software", "maintenance_visits"]),
+}
+
+def can_access_table(role, tablename):
+    '''
+    Return
+    res: True if users logged in with role may open the table (case-insensitive)
+    '''
+    if role not in ROLE_TABLES:
+        return False
+    allowed = ROLE_TABLES[role]
+    return allowed is None or str(tablename).lower() in allowed
+
+def accessible_tables(role, tables):
+    '''
+    Return
+    res: The tables of the list that users logged in with role may open, in the same order
+    '''
+    return [table for table in tables if can_access_table(role, table)]
+
+
+class SoftwareAccessCache:
+    '''
+    Per-user cache of the software a user may check out through the groups they belong to
+    (UserGroupMembers joined with SoftwareGroupAccess), kept as a frozenset of software ids.
+
+    A user's set is loaded with one query at login (or on first use) and then answers access
+    checks without touching the database. Changes to a user's groups invalidate that user;
+    changes to the access of a group invalidate everybody. Each invalidation bumps a generation
+    (per user, or global), and a load only stores its result if neither generation changed during
+    its query, so a load racing an invalidation never caches the access from before the change.
+    Changes made by other processes are picked up once an entry is older than max_age seconds.
+    '''
+
+    def __init__(self, max_age=300):
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._entries = {}      # user id -> (loaded at, frozenset of software ids)
+        self._generation = 0
+        self._user_generations = {}     # user id -> generation, bumped by invalidate_user
+
+    def load(self, mysql, user_id):
+        '''
+        Reads the software a user has access to into the cache
+        mysql: mysql connection object
+
+        Return
+        res: frozenset of software ids
+        '''
+        user_id = int(user_id)
+        with self._lock:
+            generations = (self._generation, self._user_generations.get(user_id, 0))
+        cursor = mysql.connection.cursor()
+        cursor.execute('''
+            SELECT DISTINCT sga.software_id
+            FROM UserGroupMembers ugm
+            JOIN SoftwareGroupAccess sga ON ugm.group_id = sga.group_id
+            WHERE ugm.user_id = %s
+        ''', (user_id,))
+        software = frozenset(row[0] for row in cursor.fetchall())
+        cursor.close()
+        with self._lock:
+            # Not cached if an invalidation happened during the query: the result may predate it
+            if generations == (self._generation, self._user_generations.get(user_id, 0)):
+                self._entries[user_id] = (time.monotonic(), software)
+        return software
+
+    def software_for(self, mysql, user_id):
+        '''
+        Return
+        res: frozenset of the software ids the user has access to
+        '''
+        with self._lock:
+            entry = self._entries.get(int(user_id))
+        if entry is not None and time.monotonic() - entry[0] <= self.max_age:
+            return entry[1]
+        return self.load(mysql, user_id)
+
+    def can_use_software(self, mysql, user_id, software_id):
+        '''
+        Return
+        res: True if one of the user's groups has access to the software
+        '''
+        return software_id in self.software_for(mysql, user_id)
+
+    def invalidate_user(self, user_id):
+        '''
+        Drops the cached access of one user (after their group memberships changed)
+        '''
+        user_id = int(user_id)
+        with self._lock:
+            self._user_generations[user_id] = self._user_generations.get(user_id, 0) + 1
+            self._entries.pop(user_id, None)
+
+    def invalidate_all(self):
+        '''
+        Drops the cached access of every user (after the access of a group changed)
+        '''
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+
+# Shared by all requests of the process
+software_access_cache = SoftwareAccessCache()
@@ -0,0 +1,157 @@
+'''
+Concurrent checkout benchmark for license_tools.checkout_license_seat.
+
+Many threads, each with its own database connection, check out seats of one license pool at once.
+Afterwards the pool must not be overcommitted: the number of successful checkouts, the number of
+LicenseUsage rows added for the pool and the seats taken from it must all agree and never exceed the
+seats the pool started with.
+
+The pool is --pool-id, by default the first pool of the software. Its other pools are given 0 seats
+for the run, so every checkout has to come from the measured pool.
+
+Group access is not part of what is measured: every user is treated as having access.
+The users' LicenseUsage rows for the software are deleted before the run. Afterwards the other pools
+get their original seat counts back and, unless --keep is given, the rows made by the run are deleted
+and the measured pool gets its original seat count back too.
+
+Usage:
+    python benchmarks/checkout_concurrency.py --software-id S001 --users 1-200 --seats 20 --threads 50
+'''
+import argparse
+import os
+import sys
+import threading
+import time
+
+import MySQLdb
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from license_tools import checkout_license_seat, CHECKED_OUT, NO_SEATS
+
+
+class Connection:
+    '''
+    Minimal stand-in for the app's mysql object: a .connection attribute
+    '''
+    def __init__(self, conn):
+        self.connection = conn
+
+
+def parse_users(spec):
+    users = []
+    for part in spec.split(','):
+        if '-' in part:
+            first, last = part.split('-')
+            users.extend(range(int(first), int(last) + 1))
+        else:
+            users.append(int(part))
+    return users
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--user', default='root')
+    parser.add_argument('--password', default=os.environ.get('MYSQL_PASSWORD', ''))
+    parser.add_argument('--db', default='cifdb')
+    parser.add_argument('--software-id', required=True)
+    parser.add_argument('--pool-id', type=int, help="LicensePool id of the pool to measure (default: the software's first)")
+    parser.add_argument('--users', required=True, help="user ids, e.g. 1-200 or 3,5,8")
+    parser.add_argument('--seats', type=int, default=10, help="available seats of the pool at the start")
+    parser.add_argument('--threads', type=int, default=50)
+    parser.add_argument('--keep', action='store_true', help="keep the checkouts made by the run")
+    args = parser.parse_args()
+
+    users = parse_users(args.users)
+    connect = lambda: MySQLdb.connect(host=args.host, user=args.user, passwd=args.password, db=args.db)
+
+    admin = connect()
+    cursor = admin.cursor()
+    placeholders = ', '.join(['%s'] * len(users))
+    cursor.execute("SELECT id, available_seats FROM LicensePool WHERE software_id = %s ORDER BY id", (args.software_id,))
+    original = dict(cursor.fetchall())
+    if not original:
+        sys.exit(f"{args.software_id} has no license pool")
+    pool_id = args.pool_id if args.pool_id is not None else min(original)
+    if pool_id not in original:
+        sys.exit(f"License pool {pool_id} is not a pool of {args.software_id}")
+    cursor.execute(f"DELETE FROM LicenseUsage WHERE software_id = %s AND user_id IN ({placeholders})",
+                   [args.software_id] + users)
+    cursor.executemany("UPDATE LicensePool SET available_seats = %s WHERE id = %s",
+                       [(args.seats if pid == pool_id else 0, pid) for pid in original])
+    admin.commit()
+
+    pending = list(users)
+    lock = threading.Lock()
+    results = []            # (status, seconds)
+    start_barrier = threading.Barrier(args.threads)
+
+    def worker():
+        mysql = Connection(connect())
+        start_barrier.wait()
+        while True:
+            with lock:
+                if not pending:
+                    break
+                user_id = pending.pop()
+            start = time.perf_counter()
+            status, _, _ = checkout_license_seat(mysql, args.software_id, user_id, '127.0.0.1', 'benchmark', True)
+            elapsed = time.perf_counter() - start
+            with lock:
+                results.append((status, elapsed))
+        mysql.connection.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+    began = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - began
+
+    cursor.execute("SELECT available_seats FROM LicensePool WHERE id = %s", (pool_id,))
+    available = cursor.fetchone()[0]
+    cursor.execute("SELECT COALESCE(SUM(available_seats), 0) FROM LicensePool WHERE software_id = %s AND id <> %s",
+                   (args.software_id, pool_id))
+    other_seats = int(cursor.fetchone()[0])
+    cursor.execute(f"SELECT COUNT(*) FROM LicenseUsage WHERE pool_id = %s AND user_id IN ({placeholders})",
+                   [pool_id] + users)
+    usage_rows = cursor.fetchone()[0]
+    admin.commit()
+
+    succeeded = sum(1 for status, _ in results if status == CHECKED_OUT)
+    denied = sum(1 for status, _ in results if status == NO_SEATS)
+    latencies = [elapsed for _, elapsed in results]
+    # The other pools had no seats to give: any seat they lost or gained is a miscount too
+    overcommits = max(0, succeeded - args.seats) + max(0, -available) + abs(usage_rows - succeeded) \
+        + abs((args.seats - available) - succeeded) + abs(other_seats)
+
+    print(f"checkouts attempted: {len(results)} in {wall:.3f}s ({len(results) / wall:.1f}/s) with {args.threads} threads")
+    print(f"succeeded: {succeeded}, denied (no seats): {denied}, other: {len(results) - succeeded - denied}")
+    print(f"pool {pool_id} seats: {args.seats} at start, {available} left, {usage_rows} usage rows; "
+          f"other pools: {other_seats} seats")
+    print(f"latency p50 {percentile(latencies, 50) * 1000:.2f}ms, p99 {percentile(latencies, 99) * 1000:.2f}ms, "
+          f"max {max(latencies, default=0) * 1000:.2f}ms")
+    print(f"overcommits: {overcommits}")
+
+    # The other pools always get their seats back; the measured one too unless its checkouts are kept
+    restore = {pid: seats for pid, seats in original.items() if pid != pool_id or not args.keep}
+    if not args.keep:
+        cursor.execute(f"DELETE FROM LicenseUsage WHERE software_id = %s AND user_id IN ({placeholders})",
+                       [args.software_id] + users)
+    cursor.executemany("UPDATE LicensePool SET available_seats = %s WHERE id = %s",
+                       [(seats, pid) for pid, seats in restore.items()])
+    admin.commit()
+    admin.close()
+    sys.exit(1 if overcommits else 0)
+
+
+if __name__ == '__main__':
+    main()
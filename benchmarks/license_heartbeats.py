@@ -0,0 +1,156 @@
+'''
+Heartbeat throughput benchmark for the license server's database connection pool.
+
+Creates --sessions active License_Sessions rows for an existing allocation, then for each
+configuration calls LicenseServer.update_heartbeat from --threads threads for --duration seconds,
+round-robin over the sessions, and reports heartbeats per second, latency percentiles and how
+saturated the pool was (checkouts that had to wait, most connections in use at once, connections
+opened).
+
+Configurations are pool sizes, plus "none": a connection opened and closed for every heartbeat,
+as the server did before it had a pool.
+
+Heartbeats are written to the database one by one unless --heartbeat-flush is given, in which
+case they are batched as by the server (the benchmark counts them when they are accepted, and the
+rows are written by one UPDATE per flush interval).
+
+The sessions made by the run are deleted afterwards unless --keep is given.
+
+Usage:
+    python benchmarks/license_heartbeats.py --allocation-id AL001 --sessions 300 --threads 32 --pool-sizes none,4,16
+'''
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+
+import mysql.connector
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'license_system'))
+from license_server import LicenseServer
+
+SESSION_PREFIX = 'BH'
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def create_sessions(db_config, allocation_id, count):
+    session_ids = [f"{SESSION_PREFIX}{i:08d}" for i in range(count)]
+    conn = mysql.connector.connect(**db_config)
+    cursor = conn.cursor()
+    cursor.executemany("""
+        INSERT INTO License_Sessions
+        (session_id, allocation_id, checkout_time, client_hostname, client_ip, heartbeat_last_time, session_status)
+        VALUES (%s, %s, NOW(), 'benchmark', '127.0.0.1', NOW(), 'active')
+        ON DUPLICATE KEY UPDATE session_status = 'active', checkin_time = NULL
+    """, [(session_id, allocation_id) for session_id in session_ids])
+    conn.commit()
+    cursor.close()
+    conn.close()
+    return session_ids
+
+
+def delete_sessions(db_config):
+    conn = mysql.connector.connect(**db_config)
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM License_Sessions WHERE session_id LIKE %s AND client_hostname = 'benchmark'",
+                   (SESSION_PREFIX + '%',))
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+
+def run(server, session_ids, threads, duration):
+    latencies = [[] for _ in range(threads)]
+    errors = [0] * threads
+    start_barrier = threading.Barrier(threads + 1)
+    stop = threading.Event()
+
+    def worker(i):
+        n = i
+        start_barrier.wait()
+        while not stop.is_set():
+            request = {'command': 'heartbeat', 'session_id': session_ids[n % len(session_ids)]}
+            n += threads
+            started = time.perf_counter()
+            response = server.process_request(request, ('127.0.0.1', 0))
+            latencies[i].append(time.perf_counter() - started)
+            if response.get('status') != 'success':
+                errors[i] += 1
+
+    workers = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(threads)]
+    for t in workers:
+        t.start()
+    start_barrier.wait()
+    started = time.perf_counter()
+    time.sleep(duration)
+    stop.set()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    all_latencies = [l for per_thread in latencies for l in per_thread]
+    return {
+        'heartbeats': len(all_latencies),
+        'errors': sum(errors),
+        'per_second': len(all_latencies) / elapsed,
+        'p50_ms': percentile(all_latencies, 50) * 1000,
+        'p99_ms': percentile(all_latencies, 99) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--user', default='root')
+    parser.add_argument('--password', default=os.environ.get('MYSQL_PASSWORD', ''))
+    parser.add_argument('--db', default='cifdb')
+    parser.add_argument('--allocation-id', required=True, help='existing License_Allocations row for the sessions')
+    parser.add_argument('--sessions', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--pool-sizes', default='none,4,16')
+    parser.add_argument('--heartbeat-flush', type=float, default=0,
+                        help='seconds between batched heartbeat writes (0 writes each heartbeat)')
+    parser.add_argument('--keep', action='store_true', help='keep the benchmark sessions')
+    args = parser.parse_args()
+
+    logging.getLogger('license_server').setLevel(logging.WARNING)
+    db_config = {'host': args.host, 'user': args.user, 'password': args.password, 'database': args.db}
+    session_ids = create_sessions(db_config, args.allocation_id, args.sessions)
+
+    print(f"{'pool':<6} {'heartbeats':>10} {'errors':>7} {'hb/s':>8} {'p50 ms':>8} {'p99 ms':>8} "
+          f"{'waits':>7} {'max use':>7} {'opened':>7}")
+    try:
+        for size in args.pool_sizes.split(','):
+            unpooled = size == 'none'
+            server = LicenseServer(db_config=db_config, pool_size=args.threads if unpooled else int(size),
+                                   heartbeat_flush_interval=args.heartbeat_flush)
+            server.running = True
+            server.monitor_heartbeats = lambda: None
+            server.start_heartbeat_monitor()
+            if unpooled:
+                # Every idle connection counts as too old: one new connection per heartbeat
+                server.db_pool.recycle = -1
+            res = run(server, session_ids, args.threads, args.duration)
+            server.stop_heartbeat_monitor()
+            stats = server.db_pool.stats()
+            server.db_pool.close()
+            server.server_socket.close()
+            print(f"{size:<6} {res['heartbeats']:>10} {res['errors']:>7} {res['per_second']:>8.0f} "
+                  f"{res['p50_ms']:>8.2f} {res['p99_ms']:>8.2f} "
+                  f"{stats['waits']:>7} {stats['max_in_use']:>7} {stats['created']:>7}")
+    finally:
+        if not args.keep:
+            delete_sessions(db_config)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+'''
+Connection throughput benchmark for the license server, threaded mode against asyncio mode.
+
+For each mode a LicenseServer is started in a child process on a free local port. Client threads
+then send `query` requests as fast as they can for a fixed time, each over a new connection (the
+one-shot protocol of older clients), and the requests per second, latency percentiles and failed
+requests (refused, reset or timed out connections, e.g. when the accept backlog overflows) are reported.
+With --persistent each client thread keeps one connection open and sends length-prefixed requests
+over it, as license_client.py does.
+
+With --no-db the server answers `query` from memory, so only connection handling is measured.
+Without it every request reads the Software tables of the configured database.
+
+Usage:
+    python benchmarks/license_server_connections.py --clients 200 --duration 10 --no-db
+    python benchmarks/license_server_connections.py --modes asyncio --backlog 1024 --workers 32 --software-id S001
+'''
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'license_system'))
+from license_protocol import send_message, recv_message
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def run_server(mode, port, backlog, workers, no_db):
+    import logging
+    from license_server import LicenseServer
+
+    logging.getLogger('license_server').setLevel(logging.WARNING)
+    server = LicenseServer(host='127.0.0.1', port=port, backlog=backlog, max_workers=workers)
+    if no_db:
+        server.process_request = lambda request, client_address: {
+            'status': 'success', 'software_name': 'benchmark', 'available_licenses': 1}
+        server.monitor_heartbeats = lambda: None
+        server.session_timeout = 120
+    if mode == 'asyncio':
+        server.start_async()
+    else:
+        server.start()
+
+
+def wait_for_port(port, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"Server on port {port} did not start")
+
+
+def request_once(port, payload, timeout):
+    with socket.create_connection(('127.0.0.1', port), timeout=timeout) as s:
+        s.sendall(payload)
+        data = s.recv(4096)
+    if not data:
+        raise ConnectionError("Empty response")
+    return json.loads(data.decode('utf-8'))
+
+
+def connect(port, timeout):
+    s = socket.create_connection(('127.0.0.1', port), timeout=timeout)
+    s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return s
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def run_clients(port, clients, duration, software_id, timeout, persistent):
+    request = {'command': 'query', 'software_id': software_id}
+    payload = json.dumps(request).encode('utf-8')
+    latencies = [[] for _ in range(clients)]
+    errors = [0] * clients
+    start_barrier = threading.Barrier(clients + 1)
+    stop = threading.Event()
+
+    def client(i):
+        sock = None
+        start_barrier.wait()
+        while not stop.is_set():
+            started = time.perf_counter()
+            try:
+                if persistent:
+                    if sock is None:
+                        sock = connect(port, timeout)
+                    send_message(sock, request)
+                    if recv_message(sock) is None:
+                        raise ConnectionError("Connection closed by the server")
+                else:
+                    request_once(port, payload, timeout)
+                latencies[i].append(time.perf_counter() - started)
+            except (OSError, ValueError):
+                errors[i] += 1
+                if sock is not None:
+                    sock.close()
+                    sock = None
+        if sock is not None:
+            sock.close()
+
+    threads = [threading.Thread(target=client, args=(i,), daemon=True) for i in range(clients)]
+    for t in threads:
+        t.start()
+    start_barrier.wait()
+    started = time.perf_counter()
+    time.sleep(duration)
+    stop.set()
+    for t in threads:
+        t.join(timeout + 1)
+    elapsed = time.perf_counter() - started
+
+    all_latencies = [l for per_client in latencies for l in per_client]
+    return {
+        'requests': len(all_latencies),
+        'errors': sum(errors),
+        'per_second': len(all_latencies) / elapsed,
+        'p50_ms': percentile(all_latencies, 50) * 1000,
+        'p99_ms': percentile(all_latencies, 99) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modes', default='threaded,asyncio')
+    parser.add_argument('--clients', type=int, default=100)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--backlog', type=int, default=128)
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--software-id', default='S001')
+    parser.add_argument('--timeout', type=float, default=5)
+    parser.add_argument('--no-db', action='store_true', help='answer queries from memory')
+    parser.add_argument('--persistent', action='store_true',
+                        help='one length-prefixed connection per client instead of one connection per request')
+    args = parser.parse_args()
+
+    print(f"{'mode':<10} {'requests':>9} {'errors':>7} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for mode in args.modes.split(','):
+        port = free_port()
+        server = multiprocessing.Process(target=run_server, daemon=True,
+                                         args=(mode, port, args.backlog, args.workers, args.no_db))
+        server.start()
+        try:
+            wait_for_port(port)
+            res = run_clients(port, args.clients, args.duration, args.software_id, args.timeout, args.persistent)
+        finally:
+            server.terminate()
+            server.join()
+        print(f"{mode:<10} {res['requests']:>9} {res['errors']:>7} {res['per_second']:>9.0f} "
+              f"{res['p50_ms']:>8.2f} {res['p99_ms']:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -9,7 +9,8 @@ CREATE TABLE vendors (
     email VARCHAR(100) NOT NULL UNIQUE,
     bank_account VARCHAR(20) NOT NULL,
     bank_name VARCHAR(100) NOT NULL,
-    phone VARCHAR(15) NOT NULL
+    phone VARCHAR(15) NOT NULL,
+    FULLTEXT INDEX ft_vendors_name (vendor_name) WITH PARSER ngram
 );
 
 CREATE TABLE equipment (
@@ -17,7 +18,11 @@ CREATE TABLE equipment (
     equipment_name VARCHAR(100) NOT NULL,
     location VARCHAR(100) NOT NULL,
     quantity INT NOT NULL,
-    remarks TEXT
+    remarks TEXT,
+    -- /edit search matches these columns with MATCH ... AGAINST
+    FULLTEXT INDEX ft_equipment_name (equipment_name) WITH PARSER ngram,
+    FULLTEXT INDEX ft_equipment_location (location) WITH PARSER ngram,
+    FULLTEXT INDEX ft_equipment_remarks (remarks) WITH PARSER ngram
 );
 
 CREATE TABLE lab_visits (
@@ -53,7 +58,8 @@ CREATE TABLE consumable_inventory (
     price_per_item DECIMAL(10, 2),
     reorder_level INT,
     FOREIGN KEY (vendor_id) REFERENCES vendors(vendor_id)
-        ON DELETE CASCADE ON UPDATE CASCADE
+        ON DELETE CASCADE ON UPDATE CASCADE,
+    FULLTEXT INDEX ft_consumable_item_name (item_name) WITH PARSER ngram
 );
 
 -- Software table with integrated licensing fields
@@ -72,7 +78,9 @@ CREATE TABLE software (
     license_port INT,
     license_protocol ENUM('TCP', 'UDP') DEFAULT 'TCP',
     FOREIGN KEY (vendor_id) REFERENCES vendors(vendor_id)
-        ON DELETE CASCADE ON UPDATE CASCADE
+        ON DELETE CASCADE ON UPDATE CASCADE,
+    FULLTEXT INDEX ft_software_name (software_name) WITH PARSER ngram,
+    FULLTEXT INDEX ft_software_usage_location (usage_location) WITH PARSER ngram
 );
 
 -- Users table
@@ -81,7 +89,8 @@ CREATE TABLE users (
     name VARCHAR(255) NOT NULL,
     email VARCHAR(255) NOT NULL UNIQUE,
     password VARCHAR(255) NOT NULL,
-    role VARCHAR(255) NOT NULL
+    role VARCHAR(255) NOT NULL,
+    INDEX idx_users_name (name) -- login looks users up by name or email
 );
 
 -- License system tables
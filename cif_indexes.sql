@@ -0,0 +1,71 @@
+-- Columns and indexes used by the web application's hot queries, for databases created before they existed.
+-- cif_database_complete.sql creates the users and FULLTEXT indexes for new databases, but not the
+-- LicenseUsage/LicenseAudit indexes nor LicenseUsage.pool_id, which are only added here.
+-- Every statement first looks in INFORMATION_SCHEMA, so this file can be run on any database, as often as needed.
+-- Run it before deploying a version whose license checkouts record pool_id.
+USE cifdb;
+
+DROP PROCEDURE IF EXISTS cif_add_column;
+DROP PROCEDURE IF EXISTS cif_add_index;
+
+DELIMITER //
+
+-- ALTER TABLE table_name_ ADD COLUMN column_name_ definition, unless the table already has that column
+CREATE PROCEDURE cif_add_column(IN table_name_ VARCHAR(64), IN column_name_ VARCHAR(64), IN definition TEXT)
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM INFORMATION_SCHEMA.COLUMNS
+                   WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = table_name_ AND COLUMN_NAME = column_name_) THEN
+        SET @cif_ddl = CONCAT('ALTER TABLE ', table_name_, ' ADD COLUMN ', column_name_, ' ', definition);
+        PREPARE cif_stmt FROM @cif_ddl;
+        EXECUTE cif_stmt;
+        DEALLOCATE PREPARE cif_stmt;
+    END IF;
+END //
+
+-- ALTER TABLE table_name_ ADD definition (e.g. "INDEX name (columns)"), unless the table has an index named index_name_
+CREATE PROCEDURE cif_add_index(IN table_name_ VARCHAR(64), IN index_name_ VARCHAR(64), IN definition TEXT)
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM INFORMATION_SCHEMA.STATISTICS
+                   WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = table_name_ AND INDEX_NAME = index_name_) THEN
+        SET @cif_ddl = CONCAT('ALTER TABLE ', table_name_, ' ADD ', definition);
+        PREPARE cif_stmt FROM @cif_ddl;
+        EXECUTE cif_stmt;
+        DEALLOCATE PREPARE cif_stmt;
+    END IF;
+END //
+
+DELIMITER ;
+
+-- A checkout takes its seat from one LicensePool row (a software can have several pools) and records
+-- which one, so the checkin gives the seat back to that pool (license_tools.release_seat).
+-- Rows checked out before the column existed stay NULL and are released to the first pool missing a seat.
+CALL cif_add_column('LicenseUsage', 'pool_id', 'INT NULL AFTER software_id');
+CALL cif_add_index('LicenseUsage', 'idx_usage_pool', 'INDEX idx_usage_pool (pool_id)');
+
+-- Login looks users up with WHERE name = ? OR email = ? (email already has a UNIQUE index)
+CALL cif_add_index('users', 'idx_users_name', 'INDEX idx_users_name (name)');
+
+-- /edit search uses MATCH (column) AGAINST ('"word"' IN BOOLEAN MODE) on columns that have a FULLTEXT
+-- index of their own. With the ngram parser the quoted phrase must match all the consecutive ngrams of the
+-- word, so it finds the word inside longer words (e.g. "scope" in "Microscope"), like the LIKE search did.
+-- Words shorter than ngram_token_size (2 by default) and the other columns use LIKE '%word%'.
+CALL cif_add_index('equipment', 'ft_equipment_name', 'FULLTEXT INDEX ft_equipment_name (equipment_name) WITH PARSER ngram');
+CALL cif_add_index('equipment', 'ft_equipment_location', 'FULLTEXT INDEX ft_equipment_location (location) WITH PARSER ngram');
+CALL cif_add_index('equipment', 'ft_equipment_remarks', 'FULLTEXT INDEX ft_equipment_remarks (remarks) WITH PARSER ngram');
+CALL cif_add_index('consumable_inventory', 'ft_consumable_item_name', 'FULLTEXT INDEX ft_consumable_item_name (item_name) WITH PARSER ngram');
+CALL cif_add_index('software', 'ft_software_name', 'FULLTEXT INDEX ft_software_name (software_name) WITH PARSER ngram');
+CALL cif_add_index('software', 'ft_software_usage_location', 'FULLTEXT INDEX ft_software_usage_location (usage_location) WITH PARSER ngram');
+CALL cif_add_index('vendors', 'ft_vendors_name', 'FULLTEXT INDEX ft_vendors_name (vendor_name) WITH PARSER ngram');
+
+-- /license_usage pages LicenseAudit and LicenseUsage newest first by (time, id), optionally filtered
+-- by software, user or action. InnoDB secondary indexes already end with the primary key (id).
+CALL cif_add_index('LicenseAudit', 'idx_audit_time', 'INDEX idx_audit_time (action_time, id)');
+CALL cif_add_index('LicenseAudit', 'idx_audit_software_time', 'INDEX idx_audit_software_time (software_id, action_time, id)');
+CALL cif_add_index('LicenseAudit', 'idx_audit_user_time', 'INDEX idx_audit_user_time (user_id, action_time, id)');
+CALL cif_add_index('LicenseAudit', 'idx_audit_action_time', 'INDEX idx_audit_action_time (action, action_time, id)');
+CALL cif_add_index('LicenseUsage', 'idx_usage_checkout_time', 'INDEX idx_usage_checkout_time (checkout_time, id)');
+CALL cif_add_index('LicenseUsage', 'idx_usage_software_time', 'INDEX idx_usage_software_time (software_id, checkout_time, id)');
+CALL cif_add_index('LicenseUsage', 'idx_usage_user_time', 'INDEX idx_usage_user_time (user_id, checkout_time, id)');
+
+DROP PROCEDURE cif_add_column;
+DROP PROCEDURE cif_add_index;
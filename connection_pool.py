@@ -0,0 +1,190 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+class PoolTimeout(Exception):
+    '''
+    Raised when no connection becomes free within the checkout timeout
+    '''
+
+
+class ConnectionPool:
+    '''
+    Bounded, thread-safe pool of database connections.
+
+    connect: callable returning a new connection
+    max_size: maximum number of open connections (idle + in use)
+    timeout: seconds a checkout waits for a free connection before raising PoolTimeout
+    recycle: idle connections older than this many seconds are closed instead of reused
+    ping_after: connections idle for longer than this many seconds are pinged before being handed out
+    discard_errors: exception types meaning the connection is broken: a with block of connection() that raises
+                    one of them closes its connection instead of giving it back (e.g. MySQLdb.OperationalError)
+    '''
+
+    def __init__(self, connect, max_size=10, timeout=10, recycle=300, ping_after=1, discard_errors=()):
+        self._connect = connect
+        self.discard_errors = tuple(discard_errors)
+        self.max_size = max_size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.ping_after = ping_after
+
+        self._cond = threading.Condition()
+        self._idle = deque()    # (connection, time it was returned), most recently used last
+        self._size = 0          # open connections, idle or in use
+        self._in_use = 0
+
+        # Statistics
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._max_wait = 0.0
+        self._max_in_use = 0
+        self._timeouts = 0
+        self._created = 0
+        self._discarded = 0
+
+    def acquire(self):
+        '''
+        Checks out a connection, waiting up to timeout seconds if max_size connections are in use
+
+        Return
+        conn: A live connection, to be given back with release()
+        '''
+        start = time.monotonic()
+        waited = False
+        while True:
+            conn = None
+            with self._cond:
+                while not self._idle and self._size >= self.max_size:
+                    remaining = self.timeout - (time.monotonic() - start)
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeout(f"No database connection free after {self.timeout}s")
+                    waited = True
+                    self._cond.wait(remaining)
+
+                if self._idle:
+                    conn, returned = self._idle.pop()
+                else:
+                    returned = None
+                self._size += 1 if conn is None else 0
+                self._in_use += 1
+                self._max_in_use = max(self._max_in_use, self._in_use)
+
+            if conn is not None:
+                idle_for = time.monotonic() - returned
+                if idle_for > self.recycle or (idle_for > self.ping_after and not self._alive(conn)):
+                    self._drop(conn)
+                    continue
+            else:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._in_use -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._created += 1
+
+            waited_for = time.monotonic() - start
+            with self._cond:
+                self._checkouts += 1
+                if waited:
+                    self._waits += 1
+                    self._wait_time += waited_for
+                    self._max_wait = max(self._max_wait, waited_for)
+            return conn
+
+    def release(self, conn, discard=False):
+        '''
+        Gives a connection back to the pool. Any open transaction is rolled back.
+        conn: connection obtained from acquire()
+        discard: if True the connection is closed instead of being reused (e.g. after a connection error)
+        '''
+        if not discard:
+            try:
+                conn.rollback()
+            except Exception:
+                discard = True
+        if discard:
+            self._drop(conn)
+            return
+        with self._cond:
+            self._in_use -= 1
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def _drop(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._in_use -= 1
+            self._discarded += 1
+            self._cond.notify()
+
+    @staticmethod
+    def _alive(conn):
+        try:
+            conn.ping()
+            return True
+        except Exception:
+            return False
+
+    @contextmanager
+    def connection(self):
+        '''
+        Context manager checking a connection out for the duration of a with block,
+        for work outside of a request (background jobs)
+        '''
+        conn = self.acquire()
+        try:
+            yield conn
+        except self.discard_errors:
+            self.release(conn, discard=True)
+            raise
+        except BaseException:
+            self.release(conn)
+            raise
+        else:
+            self.release(conn)
+
+    def close(self):
+        '''
+        Closes the idle connections (connections in use are closed when they are given back with discard=True,
+        or reused otherwise)
+        '''
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._in_use += len(idle)
+        for conn, _ in idle:
+            self._drop(conn)
+
+    def stats(self):
+        '''
+        Return
+        res: Dictionary with the pool size, connections in use and checkout wait statistics
+        '''
+        with self._cond:
+            return {
+                'max_size': self.max_size,
+                'open': self._size,
+                'in_use': self._in_use,
+                'max_in_use': self._max_in_use,
+                'idle': len(self._idle),
+                'checkouts': self._checkouts,
+                'waits': self._waits,
+                'wait_time_total': round(self._wait_time, 6),
+                'wait_time_max': round(self._max_wait, 6),
+                'timeouts': self._timeouts,
+                'created': self._created,
+                'discarded': self._discarded,
+            }
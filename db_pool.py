@@ -0,0 +1,61 @@
+import MySQLdb
+import MySQLdb.cursors
+from flask import g
+
+# The pool itself has no dependencies, so the license server uses it too
+from connection_pool import ConnectionPool, PoolTimeout
+
+
+class MySQLPool:
+    '''
+    Drop-in replacement for flask_mysqldb.MySQL backed by a ConnectionPool.
+
+    mysql.connection checks a connection out of the pool the first time it is used in an
+    app context and gives it back when the context is torn down.
+
+    Reads MYSQL_HOST, MYSQL_PORT, MYSQL_USER, MYSQL_PASSWORD, MYSQL_DB, MYSQL_CURSORCLASS and
+    MYSQL_POOL_SIZE, MYSQL_POOL_TIMEOUT, MYSQL_POOL_RECYCLE from the app config.
+
+    instrument: optional callable wrapping each connection handed out by mysql.connection
+    (e.g. to count the statements of a request, see metrics.Metrics)
+    '''
+
+    def __init__(self, app=None):
+        self.pool = None
+        self.instrument = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        config = app.config
+        kwargs = {
+            'host': config.get('MYSQL_HOST', 'localhost'),
+            'port': config.get('MYSQL_PORT', 3306),
+            'user': config.get('MYSQL_USER', 'root'),
+            'passwd': config.get('MYSQL_PASSWORD') or '',
+            'db': config.get('MYSQL_DB'),
+            'charset': 'utf8mb4',
+        }
+        if config.get('MYSQL_CURSORCLASS'):
+            kwargs['cursorclass'] = getattr(MySQLdb.cursors, config['MYSQL_CURSORCLASS'])
+        kwargs = {k: v for k, v in kwargs.items() if v is not None}
+
+        self.pool = ConnectionPool(lambda: MySQLdb.connect(**kwargs),
+                                   max_size=config.get('MYSQL_POOL_SIZE', 10),
+                                   timeout=config.get('MYSQL_POOL_TIMEOUT', 10),
+                                   recycle=config.get('MYSQL_POOL_RECYCLE', 300),
+                                   discard_errors=(MySQLdb.OperationalError,))
+        app.teardown_appcontext(self.teardown)
+
+    @property
+    def connection(self):
+        if 'mysql_conn' not in g:
+            g.mysql_conn = self.pool.acquire()
+            g.mysql_view = self.instrument(g.mysql_conn) if self.instrument else g.mysql_conn
+        return g.mysql_view
+
+    def teardown(self, exception):
+        g.pop('mysql_view', None)
+        conn = g.pop('mysql_conn', None)
+        if conn is not None:
+            self.pool.release(conn, discard=isinstance(exception, self.pool.discard_errors))
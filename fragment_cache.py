@@ -0,0 +1,121 @@
+import threading
+import time
+from collections import OrderedDict
+
+class FragmentCache:
+    '''
+    LRU cache of rendered HTML fragments (e.g. the table of /edit), bounded by total size.
+
+    Keys embed a per-table version counter. Writes to a table bump its version, which
+    makes every cached fragment of that table unreachable; they then age out of the LRU.
+    Versions are kept per process, so writes made outside this process (another worker,
+    the license server, a mysql shell) are only picked up once max_age has passed.
+
+    max_bytes: total size of the cached fragments (in characters) before the least recently used are evicted
+    max_age: seconds a fragment is served before it is rendered again regardless of versions
+    '''
+
+    def __init__(self, max_bytes=8 * 1024 * 1024, max_age=300):
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # key -> (html, meta, size, stored at)
+        self._versions = {}             # lower case table name -> version
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def version(self, table):
+        '''
+        Return
+        res: Current version of the table
+        '''
+        with self._lock:
+            return self._versions.get(str(table).lower(), 0)
+
+    def bump(self, table):
+        '''
+        Marks every cached fragment of the table as stale
+        table: name of the table that was modified
+        '''
+        with self._lock:
+            name = str(table).lower()
+            self._versions[name] = self._versions.get(name, 0) + 1
+
+    def key(self, table, role, *extra):
+        '''
+        Builds the cache key of a fragment of table rendered for role
+        extra: anything else the fragment depends on (page, sort order...)
+        '''
+        return (str(table).lower(), self.version(table), role) + extra
+
+    def get(self, key):
+        '''
+        Return
+        res: (html, meta) stored under key, or None
+        '''
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[3] > self.max_age:
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0], entry[1]
+
+    def put(self, key, html, meta=None):
+        '''
+        Stores a fragment, evicting the least recently used ones if the cache is over max_bytes
+        key: key from key()
+        html: the rendered fragment
+        meta: any small value to keep along with it
+        '''
+        size = len(html)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (html, meta, size, time.monotonic())
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry[2]
+
+    def cached_chunks(self, key, chunks, meta=None):
+        '''
+        Passes through a generator of html chunks and stores the joined result once it has been fully consumed
+        '''
+        parts = []
+        for chunk in chunks:
+            parts.append(chunk)
+            yield chunk
+        self.put(key, "".join(parts), meta)
+
+    def stats(self):
+        '''
+        Return
+        res: Dictionary with hit, miss and eviction counters and the current size
+        '''
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+
+# Shared by all requests of the process
+fragments = FragmentCache()
@@ -1,50 +1,139 @@
 import re
+import base64
+import json
+from html import escape
 
-def nested_list_to_html_table(table: list, buttons: bool = False):
+def cell_html(value):
     '''
-    Converts a nested list to an HTML table with modern styling.
-    The first row of the list is used as table headers.
-    If buttons is True, action buttons (delete, update) are added to each row.
-    
+    Escapes a value for use as the content of a table cell (NULL is shown empty)
+    '''
+    return "" if value is None else escape(str(value))
+
+
+def encode_row_key(values):
+    '''
+    Encodes the primary key values of a row into the opaque token carried by its action buttons
+    '''
+    raw = json.dumps(list(values), default=str).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def decode_row_key(token):
+    '''
+    Inverse of encode_row_key
+
     Returns:
-    html_string: The corresponding table in html format as a string
+    values: List of the primary key values, or None if the token is missing or malformed
     '''
+    try:
+        values = json.loads(base64.urlsafe_b64decode(str(token).encode('ascii')))
+    except (ValueError, TypeError):
+        return None
+    return values if isinstance(values, list) else None
+
 
-    columns = table[0]
-    html_string = '<thead><tr>'
+def iter_html_table(table, buttons: bool = False, key_indexes=(), chunk_rows: int = 200):
+    '''
+    Generator version of nested_list_to_html_table, for streaming large tables.
+    Yields the table head, then the body in chunks of chunk_rows rows, each chunk built with a single join.
+    All values are HTML escaped.
     
-    if buttons:
-        html_string += "<th>Actions</th>"
+    Yields:
+    html_string: The next part of the table in html format
+    '''
+    if hasattr(table, 'header'):
+        columns, rows = table.header, table.rows
     else:
-        html_string += "<th>#</th>"
-        
-    for col in columns:
-        html_string += "<th>" + str(col) + "</th>"
-    
-    html_string += "</tr></thead><tbody>"
-    
-    for i, row in enumerate(table[1:]):
-        html_string += "<tr>"
-        
+        columns, rows = table[0], table[1:]
+    # Rows without a primary key cannot be addressed one by one
+    buttons = buttons and bool(key_indexes)
+
+    head = ["<thead><tr>", "<th>Actions</th>" if buttons else "<th>#</th>"]
+    head.extend("<th>" + escape(str(col)) + "</th>" for col in columns)
+    head.append("</tr></thead><tbody>")
+    yield "".join(head)
+
+    parts = []
+    for i, row in enumerate(rows):
+        parts.append("<tr>")
+
         if buttons:
-            html_string += """<td class="action-cell">
+            key = escape(encode_row_key(row[i] for i in key_indexes), quote=True)
+            parts.append("""<td class="action-cell">
             <form method="post" class="action-buttons">
-                <button name='delete_button' value='""" + ','.join([str(x) for x in row]) + """' class='icon-button delete' title="Delete">
+                <button name='delete_button' value='""" + key + """' class='icon-button delete' title="Delete">
                     <i class="fas fa-trash-alt"></i>
                 </button>
-                <button name='update_button' value='""" + ','.join([str(x) for x in row]) + """' class='icon-button edit' title="Edit">
+                <button name='update_button' value='""" + key + """' class='icon-button edit' title="Edit">
                     <i class="fas fa-edit"></i>
                 </button>
             </form></td>
-            """
+            """)
         else:
-            html_string += "<td>" + str(i + 1) + "</td>"
+            parts.append("<td>" + str(i + 1) + "</td>")
 
         for cell in row:
-            html_string += "<td>" + str(cell) + "</td>"
+            parts.append("<td>" + cell_html(cell) + "</td>")
+
+        parts.append("</tr>")
+
+        if (i + 1) % chunk_rows == 0:
+            yield "".join(parts)
+            parts = []
 
-        html_string += "</tr>"
+    parts.append("</tbody>")
+    yield "".join(parts)
+
+
+def nested_list_to_html_table(table: list, buttons: bool = False, key_indexes=()):
+    '''
+    Converts a nested list (or a sql_tools ResultSet) to an HTML table with modern styling.
+    The first row of the list (the header of a ResultSet) is used as table headers.
+    If buttons is True, action buttons (delete, update) are added to each row.
+    The buttons carry only the primary key of their row (the columns key_indexes, see encode_row_key);
+    tables without a primary key get no buttons.
     
+    Returns:
+    html_string: The corresponding table in html format as a string
+    '''
+    return "".join(iter_html_table(table, buttons, key_indexes))
+
+
+def change_set_to_html_table(change: dict):
+    '''
+    Converts a change set returned by the sql_tools write helpers into an HTML table.
+    Every affected row is shown once per state it exists in (before and/or after the write),
+    and cells whose value changed are highlighted.
+    
+    Returns:
+    html_string: The corresponding diff table in html format as a string
+    '''
+    columns = change['columns']
+    pos = columns.index(change['key'])
+    before = {row[pos]: row for row in change['before']}
+    after = {row[pos]: row for row in change['after']}
+
+    html_string = '<thead><tr><th>Change</th>'
+    for col in columns:
+        html_string += "<th>" + escape(str(col)) + "</th>"
+    html_string += "</tr></thead><tbody>"
+
+    for key in change['keys']:
+        old, new = before.get(key), after.get(key)
+        if old is not None:
+            label = "Deleted" if new is None else "Before"
+            html_string += "<tr class='diff-old'><td>" + label + "</td>"
+            for cell in old:
+                html_string += "<td>" + cell_html(cell) + "</td>"
+            html_string += "</tr>"
+        if new is not None:
+            label = "Inserted" if old is None else "After"
+            html_string += "<tr class='diff-new'><td>" + label + "</td>"
+            for i, cell in enumerate(new):
+                changed = old is not None and old[i] != cell
+                html_string += ("<td class='diff-changed'>" if changed else "<td>") + cell_html(cell) + "</td>"
+            html_string += "</tr>"
+
     html_string += "</tbody>"
 
     return html_string
@@ -63,7 +152,7 @@ def nested_list_to_html_select(nested_list: list):
 
     for sub_list in nested_list[1:]:
         for option in sub_list:
-            select_string += "<option value='" + str(option) + "'>" + str(option) + "</option>"
+            select_string += "<option value='" + escape(str(option), quote=True) + "'>" + escape(str(option)) + "</option>"
 
     return select_string
 
@@ -81,14 +170,15 @@ def nested_list_to_html_select_2(nested_list: list):
 
     for sub_list in nested_list[1:]:
         for option in sub_list:
-            select_string += "<option value='" + str(option) + "'>" + str(option) + "</option>"
+            select_string += "<option value='" + escape(str(option), quote=True) + "'>" + escape(str(option)) + "</option>"
 
     return select_string
 
 
-def get_insert_form(columns: list):
+def get_insert_form(columns: list, optional: set = frozenset()):
     '''
     Creates a modern insert form with form controls for each column.
+    Columns in optional (nullable columns) may be left empty.
     
     Returns:
     form_string: String containing the insert form with modern styling
@@ -96,19 +186,21 @@ def get_insert_form(columns: list):
     form_string = ""
 
     for col_name in columns:
+        required = "" if col_name in optional else "required"
         form_string += """
         <div class="form-group">
             <label class="form-label" for="insert_""" + str(col_name) + """">""" + str(col_name) + """</label>
-            <input type="text" id="insert_""" + str(col_name) + """" name='""" + str(col_name) + """' placeholder='""" + str(col_name) + """' class="form-control" required>
+            <input type="text" id="insert_""" + str(col_name) + """" name='""" + str(col_name) + """' placeholder='""" + str(col_name) + """' class="form-control" """ + required + """>
         </div>
         """
 
     return form_string
 
 
-def get_update_form(columns: list, values: list):
+def get_update_form(columns: list, values: list, optional: set = frozenset()):
     '''
     Creates a modern update form with form controls for each column, pre-populated with current values.
+    Columns in optional (nullable columns) may be left empty, NULL values are shown empty.
     
     Returns:
     form_string: String containing the update form with modern styling
@@ -116,10 +208,12 @@ def get_update_form(columns: list, values: list):
     form_string = ""
 
     for col, val in zip(columns, values):
+        required = "" if col in optional else "required"
+        val = "" if val is None else escape(str(val), quote=True)
         form_string += """
         <div class="form-group">
             <label class="form-label" for="update_""" + str(col) + """">""" + str(col) + """</label>
-            <input type="text" id="update_""" + str(col) + """" name='""" + str(col) + """' placeholder='""" + str(col) + """' class="form-control" value='""" + str(val) + """' required>
+            <input type="text" id="update_""" + str(col) + """" name='""" + str(col) + """' placeholder='""" + str(col) + """' class="form-control" value='""" + val + """' """ + required + """>
         </div>
         """
 
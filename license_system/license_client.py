@@ -1,4 +1,5 @@
 import socket
+import select
 import json
 import threading
 import time
@@ -8,6 +9,16 @@ import logging
 import traceback
 from datetime import datetime
 
+try:
+    from license_protocol import send_message, recv_message, ProtocolError
+except ImportError:
+    from license_system.license_protocol import send_message, recv_message, ProtocolError
+
+# Requests that can be sent again when the connection breaks before the response arrives: the server
+# may already have processed the first copy, so a checkout or checkin is never resent (it could take a
+# second seat or release a seat twice)
+IDEMPOTENT_COMMANDS = frozenset(['heartbeat', 'query', 'stats'])
+
 # Set up logging with trace IDs
 def setup_logger():
     """Set up the license client logger with trace ID support"""
@@ -77,6 +88,9 @@ class LicenseClient:
             self.last_heartbeat_time = None
             self.heartbeat_interval = 30  # seconds
             self.trace_id = ctx.trace_id
+            # One connection to the server, shared by the heartbeat thread and the caller
+            self.sock = None
+            self.sock_lock = threading.Lock()
             
             logger.info(f"License client initialized for software {software_id}, user {user_id}", 
                      extra={'trace_id': ctx.trace_id})
@@ -120,72 +134,108 @@ class LicenseClient:
                           extra={'trace_id': ctx.trace_id})
                 return "unknown-host"  # Fallback
     
+    def connect(self, ctx):
+        """Open the connection to the license server"""
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        s.settimeout(10)  # 10 second timeout
+        logger.debug(f"Connecting to {self.server_ip}:{self.server_port}", 
+                  extra={'trace_id': ctx.trace_id})
+        connect_start = time.time()
+        try:
+            s.connect((self.server_ip, self.server_port))
+        except Exception:
+            s.close()
+            raise
+        s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        connect_time = time.time() - connect_start
+        logger.debug(f"Connected in {connect_time:.3f}s", extra={'trace_id': ctx.trace_id})
+        return s
+    
+    def close(self):
+        """Close the connection to the license server (it is reopened by the next request)"""
+        with self.sock_lock:
+            self._close_socket()
+    
+    def _server_closed(self):
+        """Whether the server has closed the idle connection (or sent something unexpected on it)"""
+        try:
+            readable, _, _ = select.select([self.sock], [], [], 0)
+        except (OSError, ValueError):
+            return True
+        return bool(readable)
+    
+    def _close_socket(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
+    
     def send_request(self, request):
-        """Send a request to the license server and get response"""
+        """Send a request to the license server and get response, over the persistent connection"""
         with TraceContext("send_request") as ctx:
-            try:
-                request_type = request.get('command', 'unknown')
-                logger.debug(f"Preparing to send {request_type} request to {self.server_ip}:{self.server_port}", 
-                          extra={'trace_id': ctx.trace_id})
-                
-                # Create socket
-                s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                s.settimeout(10)  # 10 second timeout
-                logger.debug(f"Socket created, timeout set to 10s", extra={'trace_id': ctx.trace_id})
-                
-                # Connect
-                logger.debug(f"Connecting to {self.server_ip}:{self.server_port}", 
-                          extra={'trace_id': ctx.trace_id})
-                connect_start = time.time()
-                
-                try:
-                    s.connect((self.server_ip, self.server_port))
-                    connect_time = time.time() - connect_start
-                    logger.debug(f"Connected in {connect_time:.3f}s", extra={'trace_id': ctx.trace_id})
-                    
-                    # Send request
-                    request_data = json.dumps(request).encode('utf-8')
-                    logger.debug(f"Sending {len(request_data)} bytes", extra={'trace_id': ctx.trace_id})
-                    s.send(request_data)
-                    
-                    # Receive response
-                    logger.debug(f"Waiting for response", extra={'trace_id': ctx.trace_id})
-                    response_data = s.recv(1024).decode('utf-8')
-                    logger.debug(f"Received {len(response_data)} bytes", extra={'trace_id': ctx.trace_id})
-                    
-                    # Close socket
-                    s.close()
-                    logger.debug(f"Socket closed", extra={'trace_id': ctx.trace_id})
-                    
-                    # Parse response
+            request_type = request.get('command', 'unknown')
+            logger.debug(f"Preparing to send {request_type} request to {self.server_ip}:{self.server_port}", 
+                      extra={'trace_id': ctx.trace_id})
+            
+            with self.sock_lock:
+                # A kept-alive connection may have been closed by the server in the meantime: it is
+                # reopened before sending if the close has already arrived, otherwise only idempotent
+                # requests are sent again on a new connection (see IDEMPOTENT_COMMANDS)
+                if self.sock is not None and self._server_closed():
+                    logger.debug(f"Connection closed by the server, reconnecting", extra={'trace_id': ctx.trace_id})
+                    self._close_socket()
+                for attempt in range(2):
+                    reused = self.sock is not None
                     try:
-                        response = json.loads(response_data)
+                        if self.sock is None:
+                            self.sock = self.connect(ctx)
+                        
+                        send_message(self.sock, request)
+                        logger.debug(f"Waiting for response", extra={'trace_id': ctx.trace_id})
+                        response = recv_message(self.sock)
+                        if response is None:
+                            raise ConnectionError("Connection closed by the server")
+                        
                         status = response.get('status', 'unknown')
                         logger.info(f"Response received with status: {status}", extra={'trace_id': ctx.trace_id})
                         return response
-                    except json.JSONDecodeError as e:
-                        logger.error(f"Invalid JSON response: {e}\nRaw data: {response_data}", 
+                    
+                    except socket.timeout:
+                        logger.error(f"Connection timeout to {self.server_ip}:{self.server_port}", 
                                   extra={'trace_id': ctx.trace_id})
-                        return {'status': 'error', 'message': f'Invalid JSON response: {e}'}
-                
-                except socket.timeout:
-                    logger.error(f"Connection timeout to {self.server_ip}:{self.server_port}", 
-                              extra={'trace_id': ctx.trace_id})
-                    s.close()
-                    return {'status': 'error', 'message': 'Connection timeout'}
-                
-                except ConnectionRefusedError:
-                    logger.error(f"Connection refused by {self.server_ip}:{self.server_port}", 
-                              extra={'trace_id': ctx.trace_id})
-                    s.close()
-                    return {'status': 'error', 'message': 'Connection refused - is the server running?'}
-                
-            except Exception as e:
-                error_details = traceback.format_exc()
-                logger.error(f"Error communicating with license server: {e}\n{error_details}", 
-                          extra={'trace_id': ctx.trace_id})
-                return {'status': 'error', 'message': str(e)}
-    
+                        self._close_socket()
+                        return {'status': 'error', 'message': 'Connection timeout'}
+                    
+                    except ConnectionRefusedError:
+                        logger.error(f"Connection refused by {self.server_ip}:{self.server_port}", 
+                                  extra={'trace_id': ctx.trace_id})
+                        self._close_socket()
+                        return {'status': 'error', 'message': 'Connection refused - is the server running?'}
+                    
+                    except ProtocolError as e:
+                        logger.error(f"Invalid response: {e}", extra={'trace_id': ctx.trace_id})
+                        self._close_socket()
+                        return {'status': 'error', 'message': f'Invalid response: {e}'}
+                    
+                    except (ConnectionError, OSError) as e:
+                        self._close_socket()
+                        if reused and attempt == 0 and request_type in IDEMPOTENT_COMMANDS:
+                            logger.warning(f"Connection lost ({e}), reconnecting", extra={'trace_id': ctx.trace_id})
+                            continue
+                        error_details = traceback.format_exc()
+                        logger.error(f"Error communicating with license server: {e}\n{error_details}", 
+                                  extra={'trace_id': ctx.trace_id})
+                        return {'status': 'error', 'message': str(e)}
+
+                    except Exception as e:
+                        error_details = traceback.format_exc()
+                        logger.error(f"Error communicating with license server: {e}\n{error_details}",
+                                  extra={'trace_id': ctx.trace_id})
+                        self._close_socket()
+                        return {'status': 'error', 'message': str(e)}
+
     def checkout_license(self):
         """Check out a license from the server"""
         with TraceContext("checkout_license") as ctx:
@@ -258,6 +308,8 @@ class LicenseClient:
                 old_session = self.session_id
                 self.session_id = None
                 logger.debug(f"Session {old_session} cleared", extra={'trace_id': ctx.trace_id})
+                # No heartbeats until the next checkout: no need to keep the connection
+                self.close()
             else:
                 error_msg = response.get('message', 'Unknown error')
                 logger.error(f"Failed to check in license: {error_msg}", extra={'trace_id': ctx.trace_id})
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+Wire format shared by the license server and client.
+
+Every message is a JSON object preceded by its length in bytes as a 4-byte big-endian unsigned
+integer, so any number of requests and responses can be exchanged over one connection and a
+message is never cut at a fixed buffer size.
+
+Older clients send a bare JSON object, read a single response and close the connection.
+A framed message never starts with '{' (that would be a length of more than 2 GB, far above
+MAX_MESSAGE_SIZE), so the first byte of a connection tells the two apart.
+"""
+import json
+import struct
+
+HEADER = struct.Struct('!I')
+
+# Largest message accepted, in bytes
+MAX_MESSAGE_SIZE = 1024 * 1024
+
+LEGACY_FIRST_BYTE = b'{'
+
+
+class ProtocolError(Exception):
+    """Raised when a peer sends a malformed or oversized message"""
+
+
+def encode_message(message):
+    """Serialize a message into a length-prefixed frame"""
+    body = json.dumps(message).encode('utf-8')
+    if len(body) > MAX_MESSAGE_SIZE:
+        raise ProtocolError(f"Message of {len(body)} bytes exceeds {MAX_MESSAGE_SIZE}")
+    return HEADER.pack(len(body)) + body
+
+
+def decode_body(body):
+    """Parse the JSON body of a frame"""
+    try:
+        return json.loads(body.decode('utf-8'))
+    except ValueError as e:
+        raise ProtocolError(f"Invalid JSON message: {e}")
+
+
+def check_length(header):
+    """Return the body length announced by a frame header"""
+    (length,) = HEADER.unpack(header)
+    if length > MAX_MESSAGE_SIZE:
+        raise ProtocolError(f"Message of {length} bytes exceeds {MAX_MESSAGE_SIZE}")
+    return length
+
+
+def recv_exactly(sock, size):
+    """Read exactly size bytes from a socket; None if the peer closed the connection first"""
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 65536))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def send_message(sock, message):
+    """Send one framed message over a blocking socket"""
+    sock.sendall(encode_message(message))
+
+
+def recv_message(sock, header=None):
+    """
+    Receive one framed message from a blocking socket.
+    header: the 4 header bytes, if the caller already read them
+    Returns None if the connection was closed between messages.
+    """
+    if header is None:
+        header = recv_exactly(sock, HEADER.size)
+        if header is None:
+            return None
+    body = recv_exactly(sock, check_length(header))
+    if body is None:
+        raise ProtocolError("Connection closed in the middle of a message")
+    return decode_body(body)
+
+
+def recv_legacy_message(sock, first=b''):
+    """
+    Receive the bare JSON request of an old one-shot client: bytes are read until they form a
+    complete JSON object, the peer stops sending, or MAX_MESSAGE_SIZE is reached.
+    first: bytes of the request already read
+    """
+    data = first
+    while True:
+        try:
+            return json.loads(data.decode('utf-8'))
+        except ValueError:
+            pass
+        if len(data) >= MAX_MESSAGE_SIZE:
+            raise ProtocolError("Unterminated legacy message")
+        chunk = sock.recv(65536)
+        if not chunk:
+            return decode_body(data)
+        data += chunk
+
+
+async def read_message(reader, header=None):
+    """asyncio version of recv_message, reading from a StreamReader"""
+    if header is None:
+        try:
+            header = await reader.readexactly(HEADER.size)
+        except EOFError:
+            return None
+    length = check_length(header)
+    try:
+        body = await reader.readexactly(length)
+    except EOFError:
+        raise ProtocolError("Connection closed in the middle of a message")
+    return decode_body(body)
+
+
+async def read_legacy_message(reader, first=b''):
+    """asyncio version of recv_legacy_message"""
+    data = first
+    while True:
+        try:
+            return json.loads(data.decode('utf-8'))
+        except ValueError:
+            pass
+        if len(data) >= MAX_MESSAGE_SIZE:
+            raise ProtocolError("Unterminated legacy message")
+        chunk = await reader.read(65536)
+        if not chunk:
+            return decode_body(data)
+        data += chunk
@@ -1,14 +1,24 @@
    # -*- coding: utf-8 -*-
 import socket
 import threading
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
 import json
 import time
-import mysql.connector
-from datetime import datetime
+import heapq
+from datetime import datetime, timedelta
 import logging
 import uuid
 import os
 import sys
+import mysql.connector
+from license_protocol import (LEGACY_FIRST_BYTE, HEADER, send_message, recv_message, recv_legacy_message,
+                              encode_message, read_message, read_legacy_message)
+
+# The connection pool is the one of the web application (connection_pool.py, in the parent directory)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from connection_pool import ConnectionPool
 
 # Set up logging
 logging.basicConfig(
@@ -22,10 +32,22 @@ logging.basicConfig(
 
 logger = logging.getLogger('license_server')
 
+# A session expires after this many heartbeat intervals without a heartbeat
+HEARTBEAT_MISSES = 4
+DEFAULT_HEARTBEAT_INTERVAL = 30  # seconds, when License_Servers has no row for this server
+
 class LicenseServer:
-    def __init__(self, host='0.0.0.0', port=27000, db_config=None):
+    def __init__(self, host='0.0.0.0', port=27000, db_config=None, backlog=128, max_workers=16, idle_timeout=300,
+                 pool_size=10, pool_timeout=10, heartbeat_flush_interval=5, session_timeout=None):
         self.host = host
         self.port = port
+        # Seconds a persistent connection may stay silent before the server closes it
+        self.idle_timeout = idle_timeout
+        # Length of the accept queue of the listening socket
+        self.backlog = backlog
+        # Threads running database work in asyncio mode
+        self.max_workers = max_workers
+        self.executor = None
         
         # Default database configuration
         self.db_config = db_config or {
@@ -35,7 +57,34 @@ class LicenseServer:
             'database': 'cifdb'
         }
         
+        # Database connections shared by all the handlers. Buffered cursors read their whole result,
+        # so a connection never goes back to the pool with unread rows
+        connect_config = {'buffered': True, **self.db_config}
+        self.db_pool = ConnectionPool(lambda: mysql.connector.connect(**connect_config),
+                                      max_size=pool_size, timeout=pool_timeout,
+                                      discard_errors=(mysql.connector.errors.OperationalError,
+                                                      mysql.connector.errors.InterfaceError))
+        
         self.active_connections = {}
+        
+        # Seconds without a heartbeat after which a session expires; unless given, HEARTBEAT_MISSES
+        # times the heartbeat_interval of this server in License_Servers (read when the server starts)
+        self.session_timeout = session_timeout
+        # Min-heap of (deadline, session_id), one entry per session in active_connections.
+        # An entry may be older than the session's last heartbeat: it is then pushed back when it comes due.
+        self.expiry_heap = []
+        # Sessions taken out of active_connections by pop_expired_sessions whose row expire_sessions has
+        # not marked expired yet. Their heartbeats are refused, so they cannot be tracked again meanwhile.
+        self.expiring_sessions = set()
+        
+        # Heartbeats of known sessions are recorded in active_connections right away and written to
+        # License_Sessions in one UPDATE every heartbeat_flush_interval seconds (0 writes each one)
+        self.heartbeat_flush_interval = heartbeat_flush_interval
+        self.pending_heartbeats = set()
+        self.heartbeat_lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.heartbeat_stats = {'received': 0, 'flushes': 0, 'rows_written': 0, 'flush_errors': 0, 'rejected': 0}
+        
         self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         self.running = False
@@ -55,18 +104,69 @@ class LicenseServer:
             logger.error(f"Error reading database password: {e}")
             return None
     
+    def start_heartbeat_monitor(self):
+        """Start heartbeat monitoring and flushing in separate threads"""
+        if self.session_timeout is None:
+            self.session_timeout = HEARTBEAT_MISSES * self.load_heartbeat_interval()
+        logger.info(f"Sessions expire after {self.session_timeout}s without a heartbeat")
+        
+        heartbeat_thread = threading.Thread(target=self.monitor_heartbeats)
+        heartbeat_thread.daemon = True
+        heartbeat_thread.start()
+        
+        if self.heartbeat_flush_interval > 0:
+            flush_thread = threading.Thread(target=self.flush_heartbeats_periodically)
+            flush_thread.daemon = True
+            flush_thread.start()
+    
+    def stop_heartbeat_monitor(self):
+        """Stop the monitoring and flushing threads and write the heartbeats not written yet"""
+        self.running = False
+        self.stop_event.set()
+        self.flush_heartbeats()
+    
+    def load_heartbeat_interval(self):
+        """Read the heartbeat interval of this server (matched by port) from License_Servers"""
+        conn = cursor = None
+        try:
+            conn = self.db_pool.acquire()
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT heartbeat_interval FROM License_Servers
+                WHERE server_port = %s AND status = 'active'
+                ORDER BY server_id
+                LIMIT 1
+            """, (self.port,))
+            row = cursor.fetchone()
+            if row and row[0]:
+                return int(row[0])
+            logger.warning(f"No active License_Servers row for port {self.port}, "
+                           f"assuming a {DEFAULT_HEARTBEAT_INTERVAL}s heartbeat interval")
+        except Exception as e:
+            logger.error(f"Error reading the heartbeat interval: {e}")
+        finally:
+            self.release_db(conn, cursor)
+        return DEFAULT_HEARTBEAT_INTERVAL
+    
+    def track_session(self, session_id, allocation_id, address):
+        """Add a session to active_connections and schedule its expiry (call with heartbeat_lock held)"""
+        now = datetime.now()
+        self.active_connections[session_id] = {
+            'allocation_id': allocation_id,
+            'last_heartbeat': now,
+            'address': address
+        }
+        heapq.heappush(self.expiry_heap, (now + timedelta(seconds=self.session_timeout or 0), session_id))
+
     def start(self):
-        """Start the license server"""
+        """Start the license server, handling each connection in its own thread"""
         try:
             self.server_socket.bind((self.host, self.port))
-            self.server_socket.listen(5)
+            self.server_socket.listen(self.backlog)
             self.running = True
-            logger.info(f"License server started on {self.host}:{self.port}")
+            logger.info(f"License server started on {self.host}:{self.port} (threaded, backlog={self.backlog})")
             
-            # Start heartbeat monitoring in a separate thread
-            heartbeat_thread = threading.Thread(target=self.monitor_heartbeats)
-            heartbeat_thread.daemon = True
-            heartbeat_thread.start()
+            self.start_heartbeat_monitor()
             
             try:
                 while self.running:
@@ -81,25 +181,118 @@ class LicenseServer:
                 logger.info("Server shutting down...")
             finally:
                 self.server_socket.close()
+                self.stop_heartbeat_monitor()
+                self.db_pool.close()
+        except Exception as e:
+            logger.error(f"Error starting server: {e}")
+
+    def start_async(self):
+        """Start the license server on an asyncio event loop"""
+        try:
+            asyncio.run(self.serve_async())
+        except KeyboardInterrupt:
+            logger.info("Server shutting down...")
         except Exception as e:
             logger.error(f"Error starting server: {e}")
+
+    async def serve_async(self):
+        """Accept connections on the event loop; database work runs on a bounded thread pool"""
+        self.server_socket.bind((self.host, self.port))
+        self.server_socket.listen(self.backlog)
+        self.server_socket.setblocking(False)
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='license-db')
+        self.running = True
+        try:
+            server = await asyncio.start_server(self.handle_client_async, sock=self.server_socket)
+            logger.info(f"License server started on {self.host}:{self.port} "
+                        f"(asyncio, backlog={self.backlog}, workers={self.max_workers})")
+            self.start_heartbeat_monitor()
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.running = False
+            self.executor.shutdown(wait=True)
+            self.server_socket.close()
+            self.stop_heartbeat_monitor()
+            self.db_pool.close()
+
+    async def handle_client_async(self, reader, writer):
+        """Handle a client connection on the event loop"""
+        client_address = writer.get_extra_info('peername')
+        loop = asyncio.get_running_loop()
+        try:
+            first = await asyncio.wait_for(reader.read(1), self.idle_timeout)
+            if not first:
+                return
+
+            if first == LEGACY_FIRST_BYTE:
+                # Old client: one bare JSON request, one response, then close
+                request = await asyncio.wait_for(read_legacy_message(reader, first), self.idle_timeout)
+                response = await loop.run_in_executor(self.executor, self.process_request, request, client_address)
+                writer.write(json.dumps(response).encode('utf-8'))
+                await writer.drain()
+                return
+
+            header = first + await asyncio.wait_for(reader.readexactly(HEADER.size - 1), self.idle_timeout)
+            while True:
+                request = await asyncio.wait_for(read_message(reader, header), self.idle_timeout)
+                if request is None:
+                    return
+                response = await loop.run_in_executor(self.executor, self.process_request, request, client_address)
+                writer.write(encode_message(response))
+                await writer.drain()
+                header = None
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            logger.debug(f"Connection from {client_address} closed")
+        except Exception as e:
+            logger.error(f"Error handling client {client_address}: {e}")
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
             
     def handle_client(self, client_socket, client_address):
-        """Handle client connections"""
+        """Handle client connections: framed requests until the client disconnects, or one legacy request"""
         try:
-            data = client_socket.recv(1024)
-            if not data:
+            client_socket.settimeout(self.idle_timeout)
+            first = client_socket.recv(1)
+            if not first:
                 return
-                
-            request = json.loads(data.decode('utf-8'))
-            response = self.process_request(request, client_address)
-            
-            client_socket.send(json.dumps(response).encode('utf-8'))
+
+            if first == LEGACY_FIRST_BYTE:
+                # Old client: one bare JSON request, one response, then close
+                request = recv_legacy_message(client_socket, first)
+                response = self.process_request(request, client_address)
+                client_socket.sendall(json.dumps(response).encode('utf-8'))
+                return
+
+            rest = client_socket.recv(HEADER.size - 1, socket.MSG_WAITALL)
+            if len(rest) < HEADER.size - 1:
+                return
+            request = recv_message(client_socket, first + rest)
+            while request is not None:
+                response = self.process_request(request, client_address)
+                send_message(client_socket, response)
+                request = recv_message(client_socket)
+        except (socket.timeout, ConnectionError):
+            logger.debug(f"Connection from {client_address} closed")
         except Exception as e:
             logger.error(f"Error handling client {client_address}: {e}")
         finally:
             client_socket.close()
     
+    def release_db(self, conn, cursor=None):
+        """Close a handler's cursor and give its connection back to the pool"""
+        if cursor is not None:
+            try:
+                cursor.close()
+            except Exception:
+                pass
+        if conn is not None:
+            self.db_pool.release(conn)
+    
     def process_request(self, request, client_address):
         """Process different types of license requests"""
         command = request.get('command')
@@ -112,6 +305,10 @@ class LicenseServer:
             return self.update_heartbeat(request)
         elif command == 'query':
             return self.query_license(request)
+        elif command == 'stats':
+            with self.heartbeat_lock:
+                heartbeats = dict(self.heartbeat_stats, pending=len(self.pending_heartbeats))
+            return {'status': 'success', 'db_pool': self.db_pool.stats(), 'heartbeats': heartbeats}
         else:
             logger.warning(f"Unknown command received: {command}")
             return {'status': 'error', 'message': 'Unknown command'}
@@ -125,8 +322,10 @@ class LicenseServer:
         
         logger.info(f"License checkout request: software={software_id}, user={user_id}, host={client_hostname}")
         
+        conn = cursor = None
+        
         try:
-            conn = mysql.connector.connect(**self.db_config)
+            conn = self.db_pool.acquire()
             cursor = conn.cursor(dictionary=True)
             
             # Check if software exists and has available licenses
@@ -192,11 +391,8 @@ class LicenseServer:
             conn.commit()
             
             # Add to active connections
-            self.active_connections[session_id] = {
-                'allocation_id': safe_allocation_id,
-                'last_heartbeat': datetime.now(),
-                'address': client_address
-            }
+            with self.heartbeat_lock:
+                self.track_session(session_id, safe_allocation_id, client_address)
             
             logger.info(f"License checked out successfully: session={session_id}")
             
@@ -215,11 +411,7 @@ class LicenseServer:
                 pass
             return {'status': 'error', 'message': f'Error checking out license: {str(e)}'}
         finally:
-            try:
-                cursor.close()
-                conn.close()
-            except:
-                pass
+            self.release_db(conn, cursor)
     
     def checkin_license(self, request):
         """Process a license check-in request"""
@@ -230,8 +422,10 @@ class LicenseServer:
         
         logger.info(f"License checkin request: session={session_id}")
         
+        conn = cursor = None
+        
         try:
-            conn = mysql.connector.connect(**self.db_config)
+            conn = self.db_pool.acquire()
             cursor = conn.cursor()
             
             cursor.execute("""
@@ -246,9 +440,9 @@ class LicenseServer:
             
             conn.commit()
             
-            # Remove from active connections
-            if session_id in self.active_connections:
-                del self.active_connections[session_id]
+            # Remove from active connections (its expiry heap entry is dropped when it comes due)
+            with self.heartbeat_lock:
+                self.active_connections.pop(session_id, None)
             
             logger.info(f"License checked in successfully: session={session_id}")
             return {'status': 'success', 'message': 'License checked in successfully'}
@@ -260,11 +454,7 @@ class LicenseServer:
                 pass
             return {'status': 'error', 'message': f'Error checking in license: {str(e)}'}
         finally:
-            try:
-                cursor.close()
-                conn.close()
-            except:
-                pass
+            self.release_db(conn, cursor)
     
     def update_heartbeat(self, request):
         """Process a heartbeat update request"""
@@ -275,8 +465,24 @@ class LicenseServer:
         
         logger.debug(f"Heartbeat update: session={session_id}")
         
+        with self.heartbeat_lock:
+            self.heartbeat_stats['received'] += 1
+            if session_id in self.expiring_sessions:
+                return {'status': 'error', 'message': 'Session expired'}
+            session = self.active_connections.get(session_id)
+            if session is not None and self.heartbeat_flush_interval > 0:
+                # Known session: the flush thread writes it to the database with the others. If the flush
+                # finds it no longer active (checked in or expired by someone else) it stops tracking it,
+                # and the next heartbeat goes to the database below and fails
+                session['last_heartbeat'] = datetime.now()
+                self.pending_heartbeats.add(session_id)
+                return {'status': 'success', 'message': 'Heartbeat updated'}
+        
+        # Session unknown to this process (e.g. checked out before a restart), or no batching: update the database now
+        conn = cursor = None
+        
         try:
-            conn = mysql.connector.connect(**self.db_config)
+            conn = self.db_pool.acquire()
             cursor = conn.cursor()
             
             cursor.execute("""
@@ -291,9 +497,15 @@ class LicenseServer:
             
             conn.commit()
             
-            # Update active connections
-            if session_id in self.active_connections:
-                self.active_connections[session_id]['last_heartbeat'] = datetime.now()
+            # Update active connections, taking over sessions this process did not check out
+            with self.heartbeat_lock:
+                if session_id in self.expiring_sessions:
+                    # Expired while the UPDATE ran: its row is about to be marked expired
+                    return {'status': 'error', 'message': 'Session expired'}
+                if session_id in self.active_connections:
+                    self.active_connections[session_id]['last_heartbeat'] = datetime.now()
+                else:
+                    self.track_session(session_id, None, None)
             
             return {'status': 'success', 'message': 'Heartbeat updated'}
         except Exception as e:
@@ -304,11 +516,75 @@ class LicenseServer:
                 pass
             return {'status': 'error', 'message': f'Error updating heartbeat: {str(e)}'}
         finally:
+            self.release_db(conn, cursor)
+    
+    def flush_heartbeats(self):
+        """
+        Write the pending heartbeats to License_Sessions, 1000 sessions per statement.
+        Sessions whose row is no longer active are no longer tracked, so their next heartbeat is refused.
+        """
+        with self.heartbeat_lock:
+            session_ids = list(self.pending_heartbeats)
+            self.pending_heartbeats.clear()
+        if not session_ids:
+            return 0
+        
+        conn = cursor = None
+        try:
+            conn = self.db_pool.acquire()
+            cursor = conn.cursor()
+            active = []
+            for i in range(0, len(session_ids), 1000):
+                chunk = session_ids[i:i + 1000]
+                placeholders = ', '.join(['%s'] * len(chunk))
+                cursor.execute(f"""
+                    SELECT session_id FROM License_Sessions
+                    WHERE session_status = 'active' AND session_id IN ({placeholders})
+                    FOR UPDATE
+                """, chunk)
+                found = [row[0] for row in cursor.fetchall()]
+                if found:
+                    cursor.execute(f"""
+                        UPDATE License_Sessions
+                        SET heartbeat_last_time = NOW()
+                        WHERE session_status = 'active' AND session_id IN ({', '.join(['%s'] * len(found))})
+                    """, found)
+                active.extend(found)
+            conn.commit()
+            rejected = set(session_ids).difference(active)
+            with self.heartbeat_lock:
+                for session_id in rejected:
+                    self.active_connections.pop(session_id, None)
+                    self.pending_heartbeats.discard(session_id)
+                self.heartbeat_stats['flushes'] += 1
+                self.heartbeat_stats['rows_written'] += len(active)
+                self.heartbeat_stats['rejected'] += len(rejected)
+            if rejected:
+                logger.warning(f"Sessions no longer active, heartbeats refused from now on: {sorted(rejected)}")
+            logger.debug(f"Flushed {len(session_ids)} heartbeats")
+            return len(active)
+        except Exception as e:
+            logger.error(f"Error flushing heartbeats: {e}")
             try:
-                cursor.close()
-                conn.close()
+                conn.rollback()
             except:
                 pass
+            # Keep them for the next flush
+            with self.heartbeat_lock:
+                self.heartbeat_stats['flush_errors'] += 1
+                self.pending_heartbeats.update(session_ids)
+            return 0
+        finally:
+            self.release_db(conn, cursor)
+    
+    def flush_heartbeats_periodically(self):
+        """Flush the pending heartbeats every heartbeat_flush_interval seconds while the server runs"""
+        logger.info(f"Starting heartbeat flush thread (every {self.heartbeat_flush_interval}s)")
+        while self.running:
+            self.stop_event.wait(self.heartbeat_flush_interval)
+            if not self.running:
+                break
+            self.flush_heartbeats()
     
     def query_license(self, request):
         """Query license information"""
@@ -316,8 +592,10 @@ class LicenseServer:
         
         logger.info(f"License query request: software={software_id}")
         
+        conn = cursor = None
+        
         try:
-            conn = mysql.connector.connect(**self.db_config)
+            conn = self.db_pool.acquire()
             cursor = conn.cursor(dictionary=True)
             
             cursor.execute("""
@@ -348,64 +626,115 @@ class LicenseServer:
             logger.error(f"Error querying license: {e}")
             return {'status': 'error', 'message': f'Error querying license: {str(e)}'}
         finally:
+            self.release_db(conn, cursor)
+    
+    def pop_expired_sessions(self, now):
+        """
+        Remove the sessions whose deadline has passed from active_connections.
+        Only heap entries that are due are looked at; an entry whose session had a heartbeat since it
+        was pushed is pushed back with the new deadline, and entries of sessions checked in are dropped.
+        Returns the expired sessions as (session_id, data) pairs.
+        """
+        timeout = timedelta(seconds=self.session_timeout)
+        expired = []
+        with self.heartbeat_lock:
+            while self.expiry_heap and self.expiry_heap[0][0] <= now:
+                _, session_id = heapq.heappop(self.expiry_heap)
+                data = self.active_connections.get(session_id)
+                if data is None:
+                    continue
+                deadline = data['last_heartbeat'] + timeout
+                if deadline > now:
+                    heapq.heappush(self.expiry_heap, (deadline, session_id))
+                    continue
+                del self.active_connections[session_id]
+                self.pending_heartbeats.discard(session_id)
+                self.expiring_sessions.add(session_id)
+                expired.append((session_id, data))
+        return expired
+    
+    def expire_sessions(self, expired):
+        """
+        Mark sessions returned by pop_expired_sessions as expired in License_Sessions, one UPDATE per
+        1000 sessions. Their heartbeats are refused until then (see expiring_sessions).
+        """
+        session_ids = [session_id for session_id, _ in expired]
+        conn = cursor = None
+        try:
+            conn = self.db_pool.acquire()
+            cursor = conn.cursor()
+            for i in range(0, len(session_ids), 1000):
+                chunk = session_ids[i:i + 1000]
+                cursor.execute(f"""
+                    UPDATE License_Sessions
+                    SET session_status = 'expired', checkin_time = NOW()
+                    WHERE session_status = 'active' AND session_id IN ({', '.join(['%s'] * len(chunk))})
+                """, chunk)
+            conn.commit()
+            with self.heartbeat_lock:
+                self.expiring_sessions.difference_update(session_ids)
+            logger.info(f"Marked {len(session_ids)} sessions as expired")
+        except Exception as e:
+            logger.error(f"Error updating expired sessions: {e}")
             try:
-                cursor.close()
-                conn.close()
+                conn.rollback()
             except:
                 pass
+            # Track them again, so they are retried on the next check
+            with self.heartbeat_lock:
+                self.expiring_sessions.difference_update(session_ids)
+                for session_id, data in expired:
+                    if session_id not in self.active_connections:
+                        self.active_connections[session_id] = data
+                        heapq.heappush(self.expiry_heap, (datetime.now(), session_id))
+        finally:
+            self.release_db(conn, cursor)
     
     def monitor_heartbeats(self):
-        """Check for stale heartbeats and mark sessions as expired"""
+        """Mark sessions as expired when their deadline passes, sleeping until the next deadline"""
         logger.info("Starting heartbeat monitoring thread")
         while self.running:
-            current_time = datetime.now()
-            expired_sessions = []
-            
-            # Find expired sessions (no heartbeat for more than 2 minutes)
-            for session_id, data in list(self.active_connections.items()):
-                if (current_time - data['last_heartbeat']).total_seconds() > 120:
-                    expired_sessions.append(session_id)
-                    logger.warning(f"Session {session_id} has expired (no heartbeat for >2 mins)")
+            expired = self.pop_expired_sessions(datetime.now())
+            for session_id, data in expired:
+                logger.warning(f"Session {session_id} has expired (no heartbeat for >{self.session_timeout}s)")
             
             # Update database for expired sessions
-            if expired_sessions:
-                try:
-                    conn = mysql.connector.connect(**self.db_config)
-                    cursor = conn.cursor()
-                    
-                    for session_id in expired_sessions:
-                        cursor.execute("""
-                            UPDATE License_Sessions
-                            SET session_status = 'expired', checkin_time = NOW()
-                            WHERE session_id = %s AND session_status = 'active'
-                        """, (session_id,))
-                        
-                        # Remove from active connections
-                        if session_id in self.active_connections:
-                            del self.active_connections[session_id]
-                    
-                    conn.commit()
-                    logger.info(f"Marked {len(expired_sessions)} sessions as expired")
-                except Exception as e:
-                    logger.error(f"Error updating expired sessions: {e}")
-                finally:
-                    try:
-                        cursor.close()
-                        conn.close()
-                    except:
-                        pass
-            
-            # Sleep for a while before checking again
-            time.sleep(30)
+            if expired:
+                self.expire_sessions(expired)
+            
+            # Sleep until the next deadline (sessions checked out meanwhile have later deadlines),
+            # waking up at least every few seconds
+            with self.heartbeat_lock:
+                next_deadline = self.expiry_heap[0][0] if self.expiry_heap else None
+            wait = 5
+            if next_deadline is not None:
+                wait = min(wait, max((next_deadline - datetime.now()).total_seconds(), 0.1))
+            self.stop_event.wait(wait)
 
 if __name__ == "__main__":
-    port = 27000
-    if len(sys.argv) > 1:
-        try:
-            port = int(sys.argv[1])
-        except:
-            pass
+    parser = argparse.ArgumentParser(description='CATLAB License Server')
+    parser.add_argument('port', nargs='?', type=int, default=27000)
+    parser.add_argument('--mode', choices=['threaded', 'asyncio'], default='threaded',
+                        help='one thread per connection, or an asyncio event loop with a bounded worker pool')
+    parser.add_argument('--backlog', type=int, default=128, help='length of the accept queue')
+    parser.add_argument('--workers', type=int, default=16, help='database worker threads in asyncio mode')
+    parser.add_argument('--idle-timeout', type=float, default=300,
+                        help='seconds before an idle persistent connection is closed')
+    parser.add_argument('--pool-size', type=int, default=10, help='database connections kept by the server')
+    parser.add_argument('--pool-timeout', type=float, default=10,
+                        help='seconds a request waits for a free database connection')
+    parser.add_argument('--heartbeat-flush', type=float, default=5,
+                        help='seconds between batched heartbeat writes (0 writes each heartbeat)')
+    parser.add_argument('--session-timeout', type=float, default=None,
+                        help=f'seconds without a heartbeat before a session expires '
+                             f'(default: {HEARTBEAT_MISSES} x heartbeat_interval of License_Servers)')
+    args = parser.parse_args()
     
-    print(f"Starting CATLAB License Server on port {port}...")
-    server = LicenseServer(port=port)
-    server.start()
+    print(f"Starting CATLAB License Server on port {args.port} ({args.mode})...")
+    server = LicenseServer(port=args.port, backlog=args.backlog, max_workers=args.workers,
+                           idle_timeout=args.idle_timeout, pool_size=args.pool_size, pool_timeout=args.pool_timeout,
+                           heartbeat_flush_interval=args.heartbeat_flush, session_timeout=args.session_timeout)
+    if args.mode == 'asyncio':
+        server.start_async()
+    else:
+        server.start()
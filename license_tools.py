@@ -0,0 +1,151 @@
+import logging
+import uuid
+from audit_log import audit
+
+logger = logging.getLogger(__name__)
+
+# Outcomes of checkout_license_seat
+CHECKED_OUT = 'checked_out'
+ALREADY_CHECKED_OUT = 'already_checked_out'
+NO_SEATS = 'no_seats'
+NO_ACCESS = 'no_access'
+
+def log_license_action(cursor, software_id, user_id, action, ip_address, details, session_id=None):
+    '''
+    Records a LicenseAudit row. It is queued and written in the background by the audit sink,
+    or with cursor, in the caller's transaction, when the sink is in strict mode (see audit_log.AuditSink)
+    action: 'checkout', 'checkin', 'deny'...
+    '''
+    audit.log(cursor, software_id, user_id, action, ip_address, details, session_id)
+
+def checkout_license_seat(mysql, software_id, user_id, ip_address, host_name, has_access):
+    '''
+    Checks out a seat of one of the license pools of a software in a single transaction.
+
+    The first pool (lowest id) that still has seats is locked (SELECT ... FOR UPDATE) while its
+    seat count and any existing checkout are read with one query, so concurrent checkouts are
+    serialized and can never take more seats than the pool has. The decrement is conditional
+    (available_seats > 0) and its rowcount is checked as well. Users without access are turned away
+    before the lock. The seat decrement and the usage row, which records the pool it came from
+    (pool_id, see release_seat), are committed together (and the audit row, when the audit sink is
+    in strict mode).
+
+    mysql: mysql connection object
+    software_id: software to check out
+    user_id: id of the user checking it out
+    ip_address, host_name: where the checkout comes from, recorded in LicenseUsage/LicenseAudit
+    has_access: whether the user's groups give access to the software (see authz.SoftwareAccessCache)
+
+    Return
+    status: CHECKED_OUT, ALREADY_CHECKED_OUT, NO_SEATS or NO_ACCESS
+    software_name: name of the software (None if the software does not exist)
+    session_id: license session of the new checkout, or None
+    '''
+    conn = mysql.connection
+    cursor = conn.cursor()
+    try:
+        if not has_access:
+            log_license_action(cursor, software_id, user_id, 'deny', ip_address, 'User does not have permission')
+            conn.commit()
+            return NO_ACCESS, None, None
+
+        cursor.execute('''
+            SELECT s.software_name, lp.id,
+                   (SELECT lu.id FROM LicenseUsage lu
+                    WHERE lu.software_id = lp.software_id AND lu.user_id = %s
+                    LIMIT 1) AS usage_id
+            FROM LicensePool lp
+            JOIN Software s ON s.software_id = lp.software_id
+            WHERE lp.software_id = %s AND lp.available_seats > 0
+            ORDER BY lp.id
+            LIMIT 1
+            FOR UPDATE OF lp
+        ''', (user_id, software_id))
+        pool = cursor.fetchone()
+
+        if pool is None:
+            # Every pool is used up (or there is none): an existing checkout is still reported as such
+            cursor.execute('''
+                SELECT s.software_name,
+                       (SELECT lu.id FROM LicenseUsage lu
+                        WHERE lu.software_id = s.software_id AND lu.user_id = %s
+                        LIMIT 1) AS usage_id
+                FROM Software s
+                WHERE s.software_id = %s
+            ''', (user_id, software_id))
+            software = cursor.fetchone()
+            software_name, usage_id = software if software else (None, None)
+            pool_id = None
+        else:
+            software_name, pool_id, usage_id = pool
+
+        if usage_id is not None:
+            # Already checked out: only refresh the heartbeat
+            cursor.execute('UPDATE LicenseUsage SET last_heartbeat = NOW() WHERE id = %s', (usage_id,))
+            conn.commit()
+            return ALREADY_CHECKED_OUT, software_name, None
+
+        if pool_id is not None:
+            cursor.execute('''
+                UPDATE LicensePool
+                SET available_seats = available_seats - 1
+                WHERE id = %s AND available_seats > 0
+            ''', (pool_id,))
+            if not cursor.rowcount:
+                pool_id = None
+
+        if pool_id is None:
+            conn.rollback()
+            log_license_action(cursor, software_id, user_id, 'deny', ip_address, 'No licenses available')
+            conn.commit()
+            return NO_SEATS, software_name, None
+
+        session_id = str(uuid.uuid4())
+        cursor.execute('''
+            INSERT INTO LicenseUsage
+            (software_id, pool_id, user_id, session_id, ip_address, host_name)
+            VALUES (%s, %s, %s, %s, %s, %s)
+        ''', (software_id, pool_id, user_id, session_id, ip_address, host_name))
+        log_license_action(cursor, software_id, user_id, 'checkout', ip_address, 'License checked out', session_id)
+        conn.commit()
+        return CHECKED_OUT, software_name, session_id
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+def release_seat(cursor, software_id, pool_id=None):
+    '''
+    Gives one seat back to the license pool a checkout came from, in the transaction of cursor.
+    A pool is never given more than its total_seats: a seat released twice (a double checkin, a return after
+    the session was already expired...) is logged and ignored.
+
+    pool_id: LicensePool id recorded in the LicenseUsage row. Rows checked out before it was recorded
+             (pool_id NULL) give the seat back to the first pool of the software that is missing one.
+
+    Return
+    res: True if a seat was given back
+    '''
+    if pool_id is None:
+        cursor.execute('''
+            SELECT id FROM LicensePool
+            WHERE software_id = %s AND available_seats < total_seats
+            ORDER BY id
+            LIMIT 1
+            FOR UPDATE
+        ''', (software_id,))
+        pool = cursor.fetchone()
+        if pool is None:
+            logger.warning("Seat of %s not released: every license pool of the software is full", software_id)
+            return False
+        pool_id = pool[0]
+    cursor.execute('''
+        UPDATE LicensePool
+        SET available_seats = available_seats + 1
+        WHERE id = %s AND available_seats < total_seats
+    ''', (pool_id,))
+    if not cursor.rowcount:
+        logger.warning("Seat of %s not released: license pool %s is full or gone", software_id, pool_id)
+        return False
+    return True
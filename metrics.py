@@ -0,0 +1,256 @@
+import threading
+import time
+
+from flask import g, has_app_context, request
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+STATEMENT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+
+# Statistics of the pools, caches and audit sink that only grow: exported as counters (<prefix>_<name>_total)
+CUMULATIVE_STATS = frozenset(['checkouts', 'waits', 'wait_time_total', 'timeouts', 'created', 'discarded',
+                              'hits', 'misses', 'evictions',
+                              'logged', 'written', 'batches', 'spilled', 'replayed', 'failures', 'dropped'])
+
+
+class Histogram:
+    '''
+    Cumulative histogram in the Prometheus sense: a count per upper bound, plus the sum and count of all values
+    '''
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+class InstrumentedCursor:
+    '''
+    Cursor proxy counting the statements executed, the time spent in them and the rows fetched
+    '''
+
+    def __init__(self, cursor, stats):
+        self._cursor = cursor
+        self._stats = stats
+
+    def execute(self, query, args=None):
+        start = time.perf_counter()
+        try:
+            return self._cursor.execute(query, args)
+        finally:
+            self._stats.record_sql(time.perf_counter() - start)
+
+    def executemany(self, query, args):
+        start = time.perf_counter()
+        try:
+            return self._cursor.executemany(query, args)
+        finally:
+            self._stats.record_sql(time.perf_counter() - start)
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None:
+            self._stats.record_rows(1)
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._cursor.fetchmany(size) if size is not None else self._cursor.fetchmany()
+        self._stats.record_rows(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self._stats.record_rows(len(rows))
+        return rows
+
+    def __iter__(self):
+        for row in self._cursor:
+            self._stats.record_rows(1)
+            yield row
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class InstrumentedConnection:
+    '''
+    Connection proxy whose cursors are InstrumentedCursors
+    '''
+
+    def __init__(self, conn, stats):
+        self._conn = conn
+        self._stats = stats
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self._conn.cursor(*args, **kwargs), self._stats)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+class Metrics:
+    '''
+    Per endpoint and method request metrics of the Flask app: a latency histogram, a histogram of the
+    SQL statements per request, and totals of requests (by status), SQL statements, time spent in the
+    database and rows fetched.
+
+    The database numbers come from the cursors of mysql.connection, which init_app wraps
+    (see InstrumentedConnection). Statements run outside of a request (background jobs) are counted
+    under the endpoint "background".
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latency = {}      # (endpoint, method) -> Histogram of seconds
+        self._statements = {}   # (endpoint, method) -> Histogram of statements per request
+        self._requests = {}     # (endpoint, method, status) -> count
+        self._db = {}           # (endpoint, method) -> [statements, seconds, rows]
+
+    def init_app(self, app, mysql):
+        '''
+        Instruments the requests of app and the connections handed out by mysql (a MySQLPool)
+        '''
+        mysql.instrument = lambda conn: InstrumentedConnection(conn, self)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+    def _before_request(self):
+        g.metrics_start = time.perf_counter()
+        g.metrics_db = [0, 0.0, 0]
+
+    def _teardown_request(self, exception):
+        start = g.pop('metrics_start', None)
+        db = g.pop('metrics_db', None)
+        if start is None:
+            return
+        elapsed = time.perf_counter() - start
+        key = (request.endpoint or 'unmatched', request.method)
+        status = 500 if exception is not None else getattr(g, 'metrics_status', 200)
+        with self._lock:
+            self._latency.setdefault(key, Histogram(LATENCY_BUCKETS)).observe(elapsed)
+            self._statements.setdefault(key, Histogram(STATEMENT_BUCKETS)).observe(db[0])
+            self._requests[key + (status,)] = self._requests.get(key + (status,), 0) + 1
+            totals = self._db.setdefault(key, [0, 0.0, 0])
+            for i, value in enumerate(db):
+                totals[i] += value
+
+    def _after_request(self, response):
+        g.metrics_status = response.status_code
+        return response
+
+    def _current(self):
+        if has_app_context():
+            current = g.get('metrics_db')
+            if current is not None:
+                return current
+        return None
+
+    def _background(self):
+        with self._lock:
+            return self._db.setdefault(('background', ''), [0, 0.0, 0])
+
+    def record_sql(self, seconds):
+        current = self._current()
+        if current is None:
+            totals = self._background()
+            with self._lock:
+                totals[0] += 1
+                totals[1] += seconds
+            return
+        current[0] += 1
+        current[1] += seconds
+
+    def record_rows(self, count):
+        current = self._current()
+        if current is None:
+            totals = self._background()
+            with self._lock:
+                totals[2] += count
+            return
+        current[2] += count
+
+    def render(self, stats=None):
+        '''
+        Renders the metrics in the Prometheus text exposition format
+        stats: Dictionary mapping a metric prefix to a dictionary of statistics (e.g. pool statistics);
+               numeric values named in CUMULATIVE_STATS are exported as the counter <prefix>_<name>_total,
+               the other numeric values as the gauge <prefix>_<name>
+
+        Return
+        res: The metrics as text
+        '''
+        lines = []
+        with self._lock:
+            latency = {k: (list(h.counts), h.sum, h.count) for k, h in self._latency.items()}
+            statements = {k: (list(h.counts), h.sum, h.count) for k, h in self._statements.items()}
+            requests = dict(self._requests)
+            db = {k: list(v) for k, v in self._db.items()}
+
+        def labels(endpoint, method, **extra):
+            pairs = [('endpoint', endpoint), ('method', method)] + list(extra.items())
+            return '{' + ','.join(f'{name}="{escape_label(value)}"' for name, value in pairs) + '}'
+
+        def histogram(name, help_text, buckets, data):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for (endpoint, method), (counts, total, count) in sorted(data.items()):
+                for bound, value in zip(buckets, counts):
+                    lines.append(f"{name}_bucket{labels(endpoint, method, le=format_bound(bound))} {value}")
+                lines.append(f"{name}_bucket{labels(endpoint, method, le='+Inf')} {count}")
+                lines.append(f"{name}_sum{labels(endpoint, method)} {total}")
+                lines.append(f"{name}_count{labels(endpoint, method)} {count}")
+
+        def counter(name, help_text, position):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for (endpoint, method), values in sorted(db.items()):
+                lines.append(f"{name}{labels(endpoint, method)} {values[position]}")
+
+        histogram('flask_request_duration_seconds', 'Request latency by endpoint and method',
+                  LATENCY_BUCKETS, latency)
+        histogram('flask_request_sql_statements', 'SQL statements executed per request',
+                  STATEMENT_BUCKETS, statements)
+
+        lines.append("# HELP flask_requests_total Requests by endpoint, method and status")
+        lines.append("# TYPE flask_requests_total counter")
+        for (endpoint, method, status), count in sorted(requests.items()):
+            lines.append(f"flask_requests_total{labels(endpoint, method, status=status)} {count}")
+
+        counter('flask_sql_statements_total', 'SQL statements executed', 0)
+        counter('flask_db_seconds_total', 'Time spent executing SQL statements', 1)
+        counter('flask_db_rows_fetched_total', 'Rows fetched from the database', 2)
+
+        for prefix, values in (stats or {}).items():
+            for name, value in sorted(values.items()):
+                if isinstance(value, bool):
+                    value = int(value)
+                if not isinstance(value, (int, float)):
+                    continue
+                if name in CUMULATIVE_STATS:
+                    name = name if name.endswith('_total') else name + '_total'
+                    lines.append(f"# TYPE {prefix}_{name} counter")
+                else:
+                    lines.append(f"# TYPE {prefix}_{name} gauge")
+                lines.append(f"{prefix}_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_bound(bound):
+    return repr(float(bound))
+
+
+# Shared by all requests of the process
+metrics = Metrics()
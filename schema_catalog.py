@@ -0,0 +1,168 @@
+import threading
+
+import MySQLdb
+
+class SchemaCatalog:
+    '''
+    Process-wide cache of the database schema: table names, column names, column types, primary keys
+    and FULLTEXT indexes.
+
+    Everything is loaded from INFORMATION_SCHEMA the first time it is needed,
+    and kept until invalidate() is called (e.g. after a table is renamed).
+    '''
+
+    def __init__(self, db_name="cifdb"):
+        self.db_name = db_name
+        self._lock = threading.Lock()
+        self._tables = None     # table name -> list of column tuples (see describe)
+        self._names = None      # lower case table name -> table name
+        self._fulltext = None   # table name -> list of column tuples covered by each FULLTEXT index
+        self._ngram_token_size = None
+
+    def load(self, mysql):
+        '''
+        Reads the schema of the database into the cache
+        mysql: mysql connection object
+        '''
+        cursor = mysql.connection.cursor()
+        cursor.execute("SELECT TABLE_NAME, COLUMN_NAME, COLUMN_TYPE, IS_NULLABLE, COLUMN_KEY, COLUMN_DEFAULT, EXTRA "
+                       "FROM INFORMATION_SCHEMA.COLUMNS WHERE TABLE_SCHEMA=%s ORDER BY TABLE_NAME, ORDINAL_POSITION",
+                       (self.db_name,))
+        tables = {}
+        for table, column, col_type, nullable, key, default, extra in cursor.fetchall():
+            tables.setdefault(table, []).append((column, col_type, nullable, key, default, extra))
+
+        cursor.execute("SELECT TABLE_NAME, INDEX_NAME, COLUMN_NAME FROM INFORMATION_SCHEMA.STATISTICS "
+                       "WHERE TABLE_SCHEMA=%s AND INDEX_TYPE='FULLTEXT' ORDER BY TABLE_NAME, INDEX_NAME, SEQ_IN_INDEX",
+                       (self.db_name,))
+        indexes = {}
+        for table, index, column in cursor.fetchall():
+            indexes.setdefault((table, index), []).append(column)
+        try:
+            cursor.execute("SELECT @@ngram_token_size")
+            ngram_token_size = int(cursor.fetchone()[0])
+        except MySQLdb.Error:
+            # Server without the ngram parser
+            ngram_token_size = 2
+        cursor.close()
+        fulltext = {}
+        for (table, _), index_columns in indexes.items():
+            fulltext.setdefault(table, []).append(tuple(index_columns))
+
+        with self._lock:
+            self._tables = tables
+            self._names = {name.lower(): name for name in tables}
+            self._fulltext = fulltext
+            self._ngram_token_size = ngram_token_size
+
+    def invalidate(self):
+        '''
+        Drops the cached schema, it is reloaded on the next lookup
+        '''
+        with self._lock:
+            self._tables = None
+            self._names = None
+            self._fulltext = None
+
+    def _snapshot(self, mysql):
+        with self._lock:
+            tables, names = self._tables, self._names
+        if tables is None:
+            self.load(mysql)
+            with self._lock:
+                tables, names = self._tables, self._names
+        return tables, names
+
+    def _name(self, mysql, tablename):
+        tables, names = self._snapshot(mysql)
+        return tablename if tablename in tables else names.get(str(tablename).lower())
+
+    def _table(self, mysql, tablename):
+        tables, _ = self._snapshot(mysql)
+        return tables.get(self._name(mysql, tablename), [])
+
+    def tables(self, mysql):
+        '''
+        Return
+        res: List of the names of all tables (and views) of the database
+        '''
+        tables, _ = self._snapshot(mysql)
+        return sorted(tables)
+
+    def has_table(self, mysql, tablename):
+        '''
+        Return
+        res: True if the table exists (case-insensitive)
+        '''
+        return bool(self._table(mysql, tablename))
+
+    def describe(self, mysql, tablename):
+        '''
+        Return
+        res: List of tuples (Field, Type, Null, Key, Default, Extra), in the same format as DESC
+        '''
+        return list(self._table(mysql, tablename))
+
+    def columns(self, mysql, tablename):
+        '''
+        Return
+        res: List of the column names of the table, in table order
+        '''
+        return [col[0] for col in self._table(mysql, tablename)]
+
+    def column_types(self, mysql, tablename):
+        '''
+        Return
+        res: Dictionary mapping each column name of the table to its mysql column type (e.g. "varchar(100)")
+        '''
+        return {col[0]: col[1] for col in self._table(mysql, tablename)}
+
+    def nullable(self, mysql, tablename):
+        '''
+        Return
+        res: Set of the columns of the table that accept NULL
+        '''
+        return {col[0] for col in self._table(mysql, tablename) if col[2] == 'YES'}
+
+    def primary_key(self, mysql, tablename):
+        '''
+        Return
+        res: Name of the first primary key column (the first column if the table has no primary key), to order
+             rows by. Rows are identified by all of primary_key_columns
+        '''
+        columns = self._table(mysql, tablename)
+        for col in columns:
+            if col[3] == 'PRI':
+                return col[0]
+        return columns[0][0] if columns else None
+
+    def primary_key_columns(self, mysql, tablename):
+        '''
+        Return
+        res: List of the primary key columns of the table, in table order (empty if it has no primary key)
+        '''
+        return [col[0] for col in self._table(mysql, tablename) if col[3] == 'PRI']
+
+    def fulltext_columns(self, mysql, tablename):
+        '''
+        Return
+        res: Set of the columns of the table that have a FULLTEXT index of their own,
+             i.e. that can be searched with MATCH (column) AGAINST (...)
+        '''
+        name = self._name(mysql, tablename)
+        with self._lock:
+            fulltext = self._fulltext or {}
+        return {index[0] for index in fulltext.get(name, []) if len(index) == 1}
+
+    def ngram_token_size(self, mysql):
+        '''
+        Return
+        res: Length of the tokens the ngram FULLTEXT parser indexes (ngram_token_size, 2 by default)
+        '''
+        self._snapshot(mysql)
+        with self._lock:
+            return self._ngram_token_size or 2
+
+
+# Shared by all requests of the process
+catalog = SchemaCatalog()
@@ -0,0 +1,242 @@
+import bisect
+import math
+import re
+import threading
+import MySQLdb.cursors
+
+# Tables covered by the global search: table -> (column shown as the title of a hit, columns indexed).
+# The first indexed column is the primary key of the table.
+SEARCH_TABLES = {
+    'equipment': ('equipment_name', ['equipment_id', 'equipment_name', 'location', 'remarks']),
+    'consumable_inventory': ('item_name', ['item_id', 'item_name', 'vendor_id']),
+    'software': ('software_name', ['software_id', 'software_name', 'version', 'license_type', 'usage_location']),
+    'vendors': ('vendor_name', ['vendor_id', 'vendor_name', 'email', 'bank_name']),
+    'maintenance_visits': ('visit_id', ['visit_id', 'vendor_id', 'equipment_id', 'visit_time']),
+}
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+def tokenize(text):
+    '''
+    Splits a text into lower case word tokens
+
+    Return
+    res: List of tokens, in order
+    '''
+    return TOKEN_RE.findall(str(text).lower())
+
+
+class SearchIndex:
+    '''
+    In-process inverted index over the rows of the SEARCH_TABLES, for search across all inventory categories.
+
+    Each row is a document identified by (table, primary key). Tables are read from the database the
+    first time they are searched (or by build()), then kept up to date from the change sets of the
+    sql_tools write helpers (see apply). Writes made outside this process are only picked up after
+    invalidate() or a rebuild.
+
+    Hits are ranked by the sum over the query terms of idf * tf / (tf + 1); terms found in the title
+    column count double. The last query term also matches as a prefix, for typeahead.
+    '''
+
+    def __init__(self, tables=SEARCH_TABLES, max_expansions=50):
+        self.tables = tables
+        self.max_expansions = max_expansions
+        self._lock = threading.RLock()
+        self._postings = {}     # token -> {doc: weight}
+        self._vocab = []        # sorted tokens, for prefix lookups
+        self._docs = {}         # doc -> (title, tokens)
+        self._built = set()     # tables loaded into the index
+        self._generations = {}  # table -> number of changes applied, to detect changes during a build
+
+    def build(self, mysql, tables=None, attempts=3):
+        '''
+        (Re)loads tables into the index
+        mysql: mysql connection object
+        tables: names of the tables to load (defaults to all SEARCH_TABLES)
+        attempts: times a table is read again when a change is applied to it while it is being read;
+                  if it keeps changing it is left as it was (and reloaded the next time it is searched)
+        '''
+        for table in list(tables or self.tables):
+            for _ in range(attempts):
+                with self._lock:
+                    if table not in self.tables:
+                        break
+                    title_col, columns = self.tables[table]
+                    generation = self._generations.get(table, 0)
+                cursor = mysql.connection.cursor(MySQLdb.cursors.Cursor)
+                cursor.execute(f"SELECT {', '.join(columns)} FROM {table}")
+                rows = cursor.fetchall()
+                cursor.close()
+                with self._lock:
+                    if self._generations.get(table, 0) != generation:
+                        # The rows read may predate that change: swapping them in would undo it
+                        continue
+                    self._drop_table(table)
+                    for row in rows:
+                        self._add(table, columns, row)
+                    self._built.add(table)
+                    break
+
+    def ensure_built(self, mysql, tables=None):
+        '''
+        Loads the tables that are not in the index yet
+        '''
+        missing = [t for t in list(tables or self.tables) if t not in self._built]
+        if missing:
+            self.build(mysql, missing)
+
+    def invalidate(self, table):
+        '''
+        Marks a table as out of date, it is reloaded the next time it is searched
+        table: name of the table (ignored if it is not searchable)
+        '''
+        table = str(table).lower()
+        with self._lock:
+            self._generations[table] = self._generations.get(table, 0) + 1
+            self._built.discard(table)
+
+    def rename(self, table, new_name):
+        '''
+        Follows a table rename: the table is searched under its new name (and reloaded on the next search)
+        '''
+        table, new_name = str(table).lower(), str(new_name).lower()
+        with self._lock:
+            if table not in self.tables:
+                return
+            self.tables[new_name] = self.tables.pop(table)
+            self._drop_table(table)
+            self._built.discard(table)
+            self._generations[table] = self._generations.get(table, 0) + 1
+            self._generations[new_name] = self._generations.get(new_name, 0) + 1
+
+    def apply(self, change):
+        '''
+        Updates the index from a change set (see sql_tools.change_set): rows in before are removed,
+        rows in after are (re)added
+        '''
+        table = str(change['table']).lower()
+        if table not in self.tables:
+            return
+        _, columns = self.tables[table]
+        header = list(change['columns'])
+        if any(col not in header for col in columns):
+            self.invalidate(table)
+            return
+        key_pos = header.index(change['key'])
+        positions = [header.index(col) for col in columns]
+        with self._lock:
+            self._generations[table] = self._generations.get(table, 0) + 1
+            for row in change['before']:
+                self._remove((table, row[key_pos]))
+            for row in change['after']:
+                self._add(table, columns, [row[p] for p in positions], key=row[key_pos])
+
+    def search(self, mysql, query, tables=None, limit=20):
+        '''
+        Searches the index
+        mysql: mysql connection object (used to load tables that are not indexed yet)
+        query: words to look for, the last one may be incomplete
+        tables: names of the tables the hits may come from (defaults to all SEARCH_TABLES)
+        limit: maximum number of hits
+
+        Return
+        res: List of hits, best first, each a dictionary with table, key, title and score
+        '''
+        tables = [t for t in list(tables or self.tables) if t in self.tables]
+        terms = tokenize(query)
+        if not terms or not tables:
+            return []
+        self.ensure_built(mysql, tables)
+        allowed = set(tables)
+
+        with self._lock:
+            total = max(len(self._docs), 1)
+            scores = {}
+            for i, term in enumerate(terms):
+                matches = [(term, 1.0)] if term in self._postings else []
+                if i == len(terms) - 1:
+                    matches += [(token, 0.8) for token in self._expand(term) if token != term]
+                seen = set()
+                for token, boost in matches:
+                    postings = self._postings[token]
+                    idf = math.log(1 + total / len(postings))
+                    for doc, weight in postings.items():
+                        if doc[0] not in allowed or doc in seen:
+                            continue
+                        # One score per document and query term: from the term itself, else its first prefix match
+                        seen.add(doc)
+                        scores[doc] = scores.get(doc, 0.0) + boost * idf * weight / (weight + 1)
+            best = sorted(scores.items(), key=lambda item: -item[1])[:limit]
+            return [{'table': doc[0], 'key': doc[1], 'title': self._docs[doc][0], 'score': round(score, 4)}
+                    for doc, score in best]
+
+    def suggest(self, mysql, prefix, tables=None, limit=10):
+        '''
+        Completions for a search box
+
+        Return
+        res: List of distinct titles of the best hits for prefix
+        '''
+        titles = []
+        for hit in self.search(mysql, prefix, tables=tables, limit=limit * 3):
+            if hit['title'] not in titles:
+                titles.append(hit['title'])
+        return titles[:limit]
+
+    def stats(self):
+        '''
+        Return
+        res: Dictionary with the number of documents and distinct tokens, and the tables loaded
+        '''
+        with self._lock:
+            return {'documents': len(self._docs), 'tokens': len(self._vocab), 'tables': sorted(self._built)}
+
+    def _expand(self, prefix):
+        start = bisect.bisect_left(self._vocab, prefix)
+        res = []
+        for token in self._vocab[start:start + self.max_expansions]:
+            if not token.startswith(prefix):
+                break
+            res.append(token)
+        return res
+
+    def _add(self, table, columns, values, key=None):
+        title_col = self.tables[table][0]
+        doc = (table, values[0] if key is None else key)
+        self._remove(doc)
+        weights = {}
+        title = ''
+        for col, value in zip(columns, values):
+            if value is None:
+                continue
+            if col == title_col:
+                title = str(value)
+            for token in tokenize(value):
+                weights[token] = weights.get(token, 0) + (2 if col == title_col else 1)
+        for token, weight in weights.items():
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = {}
+                bisect.insort(self._vocab, token)
+            postings[doc] = weight
+        self._docs[doc] = (title, tuple(weights))
+
+    def _remove(self, doc):
+        entry = self._docs.pop(doc, None)
+        if entry is None:
+            return
+        for token in entry[1]:
+            postings = self._postings[token]
+            postings.pop(doc, None)
+            if not postings:
+                del self._postings[token]
+                del self._vocab[bisect.bisect_left(self._vocab, token)]
+
+    def _drop_table(self, table):
+        for doc in [doc for doc in self._docs if doc[0] == table]:
+            self._remove(doc)
+
+
+# Shared by all requests of the process
+search_index = SearchIndex()
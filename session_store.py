@@ -0,0 +1,214 @@
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from flask.sessions import SessionInterface, SessionMixin, session_json_serializer
+from werkzeug.datastructures import CallbackDict
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    '''
+    Session whose data is kept on the server; the cookie only carries its id (sid)
+    '''
+
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(self):
+            self.modified = True
+        CallbackDict.__init__(self, initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+        self.replaced_sid = None    # previous id after rotate(), deleted from the store when the session is saved
+
+    def rotate(self, sid):
+        '''
+        Moves the session data to the new id sid; the old id stops working when the response is sent
+        '''
+        if self.replaced_sid is None and not self.new:
+            self.replaced_sid = self.sid
+        self.sid = sid
+        self.new = True
+        self.modified = True
+
+
+class MemorySessionStore:
+    '''
+    Sessions kept in the memory of the process: an LRU of at most max_entries sessions,
+    each dropped after ttl seconds without being used. Only for a single worker process.
+    '''
+
+    def __init__(self, max_entries=10000, ttl=8 * 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # sid -> (expires at, data)
+
+    def load(self, sid):
+        '''
+        Return
+        res: Dictionary with the data of the session, or None if it does not exist or has expired
+        '''
+        with self._lock:
+            entry = self._entries.get(sid)
+            if entry is None:
+                return None
+            if entry[0] < time.time():
+                del self._entries[sid]
+                return None
+            self._entries[sid] = (time.time() + self.ttl, entry[1])
+            self._entries.move_to_end(sid)
+            return dict(entry[1])
+
+    def save(self, sid, data):
+        with self._lock:
+            self._entries[sid] = (time.time() + self.ttl, dict(data))
+            self._entries.move_to_end(sid)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, sid):
+        with self._lock:
+            self._entries.pop(sid, None)
+
+    def stats(self):
+        with self._lock:
+            return {'backend': 'memory', 'sessions': len(self._entries), 'max_entries': self.max_entries}
+
+
+class SQLiteSessionStore:
+    '''
+    Sessions kept in a SQLite file, shared by all the worker processes of a host.
+    Sessions expire after ttl seconds without being used (the expiry is pushed back when less than half of
+    it is left, so reads rarely write). Expired rows are purged every purge_every saves.
+    '''
+
+    def __init__(self, path='sessions.sqlite3', ttl=8 * 3600, purge_every=1000):
+        self.path = path
+        self.ttl = ttl
+        self.purge_every = purge_every
+        self._local = threading.local()
+        self._saves = 0
+        conn = self._connection()
+        conn.execute("CREATE TABLE IF NOT EXISTS sessions (sid TEXT PRIMARY KEY, data TEXT NOT NULL, expires REAL NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS sessions_expires ON sessions (expires)")
+        conn.commit()
+
+    def _connection(self):
+        # sqlite3 connections cannot be shared between threads
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def load(self, sid):
+        conn = self._connection()
+        row = conn.execute("SELECT data, expires FROM sessions WHERE sid = ?", (sid,)).fetchone()
+        now = time.time()
+        if row is None or row[1] < now:
+            return None
+        if row[1] - now < self.ttl / 2:
+            conn.execute("UPDATE sessions SET expires = ? WHERE sid = ?", (now + self.ttl, sid))
+            conn.commit()
+        return session_json_serializer.loads(row[0])
+
+    def save(self, sid, data):
+        conn = self._connection()
+        conn.execute("INSERT OR REPLACE INTO sessions (sid, data, expires) VALUES (?, ?, ?)",
+                     (sid, session_json_serializer.dumps(dict(data)), time.time() + self.ttl))
+        self._saves += 1
+        if self._saves % self.purge_every == 0:
+            conn.execute("DELETE FROM sessions WHERE expires < ?", (time.time(),))
+        conn.commit()
+
+    def delete(self, sid):
+        conn = self._connection()
+        conn.execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+        conn.commit()
+
+    def stats(self):
+        count = self._connection().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+        return {'backend': 'sqlite', 'sessions': count, 'path': self.path}
+
+
+class ServerSessionInterface(SessionInterface):
+    '''
+    Flask session interface keeping the session data in a store (MemorySessionStore or SQLiteSessionStore).
+    The session cookie only holds a random session id.
+    '''
+
+    def __init__(self, store):
+        self.store = store
+
+    @staticmethod
+    def new_sid():
+        return secrets.token_urlsafe(32)
+
+    def regenerate(self, session):
+        '''
+        Gives the session a new id, keeping its data, so an id known before (e.g. planted in the browser by
+        someone else) is not the id of the logged in session. Call at login and whenever the privileges of
+        the session change.
+        '''
+        session.rotate(self.new_sid())
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            data = self.store.load(sid)
+            if data is not None:
+                return ServerSession(data, sid=sid)
+        return ServerSession(sid=self.new_sid(), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if session.replaced_sid is not None:
+            self.store.delete(session.replaced_sid)
+            session.replaced_sid = None
+
+        if not session:
+            # Emptied (e.g. logout): forget it on both sides
+            if session.modified:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        if session.modified or self.should_set_cookie(app, session):
+            self.store.save(session.sid, session)
+        if session.new or self.should_set_cookie(app, session):
+            response.set_cookie(name, session.sid,
+                                expires=self.get_expiration_time(app, session),
+                                httponly=self.get_cookie_httponly(app),
+                                domain=domain, path=path,
+                                secure=self.get_cookie_secure(app),
+                                samesite=self.get_cookie_samesite(app))
+
+    def stats(self):
+        return self.store.stats()
+
+
+def make_session_interface(app):
+    '''
+    Builds the session interface selected by SESSION_BACKEND in the app config:
+    'memory' (default), 'sqlite' (SESSION_SQLITE_PATH) or 'cookie' (Flask's signed cookie sessions).
+    Sessions are dropped after SESSION_TTL seconds without a request.
+
+    Return
+    res: ServerSessionInterface, or None for 'cookie'
+    '''
+    backend = app.config.get('SESSION_BACKEND', 'memory')
+    ttl = app.config.get('SESSION_TTL', 8 * 3600)
+    if backend == 'cookie':
+        return None
+    if backend == 'sqlite':
+        return ServerSessionInterface(SQLiteSessionStore(app.config.get('SESSION_SQLITE_PATH', 'sessions.sqlite3'), ttl=ttl))
+    if backend == 'memory':
+        return ServerSessionInterface(MemorySessionStore(app.config.get('SESSION_MAX_ENTRIES', 10000), ttl=ttl))
+    raise ValueError(f"Unknown SESSION_BACKEND {backend!r}")
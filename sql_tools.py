@@ -1,56 +1,136 @@
 import MySQLdb.cursors
+import base64
+import json
+import re
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from schema_catalog import catalog
+from fragment_cache import fragments
+from search_index import search_index
 
-def convert(raw_out, type):
+class Row:
     '''
-    Converts the format returned by cursor.fetchall() to something more palatable for the user
+    One row of a ResultSet: a view over the row tuple that also allows access by column name,
+    as row['name'] or row.name, without building a dictionary per row.
+    '''
+    __slots__ = ('_index', '_values')
 
-    input
-    raw_out: unprocessed output of cursor.fetchall()
-    type: type of sql command used
+    def __init__(self, index, values):
+        self._index = index
+        self._values = values
 
-    Return
-    res: Format specified for the web app
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self._values[self._index[key]]
+        return self._values[key]
+
+    def __getattr__(self, name):
+        try:
+            return self._values[self._index[name]]
+        except KeyError:
+            raise AttributeError(name)
+
+    def get(self, key, default=None):
+        pos = self._index.get(key)
+        return default if pos is None else self._values[pos]
+
+    def keys(self):
+        return list(self._index)
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __repr__(self):
+        return f"Row({dict(zip(self._index, self._values))!r})"
+
+
+class ResultSet:
     '''
+    Compact query result: one shared header tuple and the rows as the tuples returned by the cursor.
 
-    res = []
+    Iterating (or indexing) gives Row views, which read columns by name lazily.
+    header: tuple of column names
+    rows: sequence of row tuples
+    '''
+    __slots__ = ('header', 'rows', '_index')
 
-    if type == "col_names":
-        res.append(['Columns in the table'])
-        for col_name in raw_out:
-            res.append([col_name['COLUMN_NAME']])
+    def __init__(self, header, rows):
+        self.header = tuple(header)
+        self.rows = rows
+        self._index = {name: i for i, name in enumerate(self.header)}
 
-    if type == "show":
-        res.append(['Tables in the database'])
-        for t in raw_out:
-            res.append(list(t.values()))
+    @classmethod
+    def from_cursor(cls, cursor):
+        '''
+        Builds a ResultSet from the remaining rows of an executed (non-dict) cursor
+        '''
+        return cls([d[0] for d in cursor.description], cursor.fetchall())
 
-    if type == "desc":
-        res.append(list(raw_out[0].keys()))
-        for t in raw_out:
-            res.append(list(t.values()))
+    def index(self, name):
+        '''
+        Return
+        res: Position of the column called name
+        '''
+        return self._index[name]
 
-    if type == "select":
-        res.append(list(raw_out[0].keys()))
-        for t in raw_out:
-            res.append(list(t.values()))
+    def column(self, name):
+        '''
+        Return
+        Generator over the values of one column
+        '''
+        pos = self._index[name]
+        return (row[pos] for row in self.rows)
 
-    return res
+    def __getitem__(self, i):
+        return Row(self._index, self.rows[i])
+
+    def __iter__(self):
+        index = self._index
+        return (Row(index, row) for row in self.rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __bool__(self):
+        return bool(self.rows)
+
+def fetch_all(cursor):
+    '''
+    Fetches all the remaining rows of an executed cursor
 
-def col_names(mysql, tablename, db_name="cifdb"):
+    Return
+    res: ResultSet of the rows
     '''
-    Obtains the names of all columns of the table as a list
+    return ResultSet.from_cursor(cursor)
+
+def fetch_row(cursor):
+    '''
+    Fetches the next row of an executed cursor
+
+    Return
+    res: Row, or None if there are no more rows
+    '''
+    values = cursor.fetchone()
+    if values is None:
+        return None
+    return Row({d[0]: i for i, d in enumerate(cursor.description)}, values)
+
+def col_names(mysql, tablename):
+    '''
+    Obtains the names of all columns of the table as a list (read from the schema catalog)
 
     mysql: mysql connection object
     tablename: name of the table whose columns we have to find
-    db_name: name of the database to be used ("cifdb")
 
     Return
     res: Returns a list containing the names of all columns
     '''
-    cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
-    cursor.execute("SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS WHERE TABLE_SCHEMA=%s and TABLE_NAME=%s", (db_name, tablename,))
-    res = cursor.fetchall()
-    res = convert(res, "col_names")
+    res = [['Columns in the table']]
+    for col_name in catalog.columns(mysql, tablename):
+        res.append([col_name])
     return res
 
 def list_to_string(list):
@@ -67,7 +147,8 @@ def list_to_string(list):
 
 def use_database(mysql, db_name='cifdb'):
     '''
-    Selects database
+    Selects database. Pooled connections already select MYSQL_DB when they are opened,
+    so this is only needed to switch to another database.
 
     mysql: mysql connection object
     db_name: name of the database to be used ("cifdb")
@@ -80,21 +161,20 @@ def use_database(mysql, db_name='cifdb'):
 
 def show_tables(mysql):
     '''
-    Shows all tables of the given database
+    Shows all tables of the given database (read from the schema catalog)
     mysql: mysql connection object
 
     Return
     res: List of tables in the database
     '''
-    cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
-    cursor.execute("SHOW TABLES")
-    res = cursor.fetchall()
-    res = convert(res, "show")
+    res = [['Tables in the database']]
+    for t in catalog.tables(mysql):
+        res.append([t])
     return res
 
 def desc_table(mysql, tablename):
     '''
-    List of dictionaries describing the table
+    List of lists describing the table (read from the schema catalog)
     
     Format: (Field (or col_name), Type (dtype), Null (allowed or not), Key, Default, Extra)
 
@@ -102,14 +182,11 @@ def desc_table(mysql, tablename):
     tablename: name of the table whose columns we have to find
 
     Return
-    res: Overview of the table. Dictionaries of the format specified above.
+    res: Overview of the table. Header row followed by one row of the format specified above per column.
     '''
-    cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
-    # Use direct string formatting for the table name - safe since tablename comes from trusted source
-    query = f"DESC {tablename}"
-    cursor.execute(query)
-    res = cursor.fetchall()
-    res = convert(res, "desc")
+    res = [['Field', 'Type', 'Null', 'Key', 'Default', 'Extra']]
+    for col in catalog.describe(mysql, tablename):
+        res.append(list(col))
     return res
 
 def select_with_headers(mysql, tablename):
@@ -119,17 +196,367 @@ def select_with_headers(mysql, tablename):
     tablename: name of the table whose columns we have to find
     
     Return
-    res: List of lists, first is list of column names, followed by list of rows in the table
+    res: ResultSet with the column names as header and the rows of the table
     '''
-    cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+    cursor = mysql.connection.cursor(MySQLdb.cursors.Cursor)
     # Use direct string formatting for the table name - safe since tablename comes from trusted source
     query = f"SELECT * FROM {tablename}"
     cursor.execute(query)
-    rows = cursor.fetchall()
-    rows = convert(rows, "select")
-    res = rows # error prone
+    res = ResultSet.from_cursor(cursor)
+    cursor.close()
     return res
 
+def encode_cursor(values):
+    '''
+    Encodes the sort key of the last row of a page into an opaque, url-safe token
+
+    values: list of the sort column values of the last row shown
+
+    Return
+    token: String that can be passed back as the "after" argument of select_page
+    '''
+    raw = json.dumps(list(values), default=str).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def decode_cursor(token):
+    '''
+    Inverse of encode_cursor
+
+    token: String produced by encode_cursor
+
+    Return
+    values: List of sort column values, or None if the token is missing or malformed
+    '''
+    if not token:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+    except (ValueError, TypeError):
+        return None
+    return values if isinstance(values, list) else None
+
+def keyset_condition(order_cols, values, descending=False):
+    '''
+    Builds the WHERE condition selecting rows that sort strictly after the given key
+    order_cols: List of columns the page is ordered by, the last one must be unique
+    values: Sort column values of the last row of the previous page
+    descending: True if the page is ordered by every column in descending order
+
+    Return
+    condition: SQL condition string with %s placeholders
+    params: List of parameters for the placeholders
+    '''
+    col, rest = order_cols[0], order_cols[1:]
+    val, rest_vals = values[0], values[1:]
+    if not rest:
+        if val is None:
+            # NULLs sort first in MySQL, and last in descending order
+            return ("FALSE" if descending else f"{col} IS NOT NULL"), []
+        if descending:
+            return f"({col} < %s OR {col} IS NULL)", [val]
+        return f"{col} > %s", [val]
+
+    tail, tail_params = keyset_condition(rest, rest_vals, descending)
+    if val is None:
+        if descending:
+            return f"({col} IS NULL AND {tail})", tail_params
+        # NULLs sort first in MySQL, so everything non-NULL comes after
+        return f"(({col} IS NULL AND {tail}) OR {col} IS NOT NULL)", tail_params
+    if descending:
+        return f"({col} < %s OR {col} IS NULL OR ({col} = %s AND {tail}))", [val, val] + tail_params
+    return f"({col} > %s OR ({col} = %s AND {tail}))", [val, val] + tail_params
+
+def select_keyset(mysql, select, conditions, params, order_cols, page_size=50, after=None, descending=False):
+    '''
+    Runs a query one page at a time with keyset pagination, for queries other than a plain table
+    (joins, filters), see select_page for tables
+    mysql: mysql connection object
+    select: SELECT ... FROM ... part of the query, without WHERE. It must return every column of
+            order_cols, under the name that follows the table alias (la.id -> id)
+    conditions: List of filter conditions with %s placeholders, combined with AND
+    params: parameters of the placeholders in conditions
+    order_cols: List of the columns to order by, the last one must be unique (e.g. ['la.action_time', 'la.id'])
+    page_size: maximum number of rows to return
+    after: cursor token returned for the previous page (None for the first page)
+    descending: True to return the rows in descending order
+
+    Return
+    res: ResultSet of the rows of the requested page
+    next_after: cursor token for the next page, or None if this is the last page
+    '''
+    conditions = list(conditions)
+    params = list(params)
+    values = decode_cursor(after)
+    if values is not None and len(values) == len(order_cols):
+        condition, keyset_params = keyset_condition(order_cols, values, descending)
+        conditions.append(condition)
+        params += keyset_params
+
+    query = select
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    direction = " DESC" if descending else ""
+    query += " ORDER BY " + ", ".join(col + direction for col in order_cols) + " LIMIT %s"
+    params.append(int(page_size) + 1)
+
+    cursor = mysql.connection.cursor(MySQLdb.cursors.Cursor)
+    cursor.execute(query, params)
+    res = ResultSet.from_cursor(cursor)
+    cursor.close()
+
+    next_after = None
+    if len(res.rows) > page_size:
+        res = ResultSet(res.header, res.rows[:page_size])
+        positions = [res.index(col.split('.')[-1]) for col in order_cols]
+        next_after = encode_cursor([res.rows[-1][p] for p in positions])
+    return res, next_after
+
+def estimate_rows(mysql, tablename, db_name="cifdb"):
+    '''
+    Cheap row count estimate for a table, read from the storage engine statistics instead of COUNT(*)
+    mysql: mysql connection object
+    tablename: name of the table
+    db_name: name of the database to be used ("cifdb")
+
+    Return
+    res: Approximate number of rows in the table (0 if unknown)
+    '''
+    cursor = mysql.connection.cursor()
+    cursor.execute("SELECT TABLE_ROWS FROM INFORMATION_SCHEMA.TABLES WHERE TABLE_SCHEMA=%s and TABLE_NAME=%s", (db_name, tablename,))
+    row = cursor.fetchone()
+    cursor.close()
+    return int(row[0]) if row and row[0] is not None else 0
+
+def select_page(mysql, tablename, page_size=50, sort_col=None, after=None):
+    '''
+    Displays one page of the table, using keyset pagination over an unbuffered server-side cursor
+    mysql: mysql connection object
+    tablename: name of the table whose rows we have to display
+    page_size: maximum number of rows to return
+    sort_col: column to order by (defaults to the first primary key column of the table)
+    after: cursor token returned for the previous page (None for the first page)
+
+    Return
+    res: ResultSet with the column names as header and the rows of the requested page
+    next_after: cursor token for the next page, or None if this is the last page
+    total: approximate number of rows in the whole table
+    '''
+    columns = catalog.columns(mysql, tablename)
+    if not columns:
+        raise ValueError(f"Unknown table {tablename}")
+    key_cols = catalog.primary_key_columns(mysql, tablename) or [catalog.primary_key(mysql, tablename)]
+    if sort_col not in columns:
+        sort_col = key_cols[0]
+    # The primary key breaks ties so that no row is skipped or repeated across pages
+    order_cols = [sort_col] + [col for col in key_cols if col != sort_col]
+
+    query = f"SELECT * FROM {tablename}"
+    params = []
+    values = decode_cursor(after)
+    if values is not None and len(values) == len(order_cols):
+        condition, params = keyset_condition(order_cols, values)
+        query += f" WHERE {condition}"
+    query += " ORDER BY " + ", ".join(order_cols) + " LIMIT %s"
+    params.append(int(page_size) + 1)
+
+    cursor = mysql.connection.cursor(MySQLdb.cursors.SSCursor)
+    try:
+        cursor.execute(query, params)
+        header = [d[0] for d in cursor.description]
+        rows = []
+        has_more = False
+        # Rows are streamed from the server one at a time; one extra row tells us if another page exists
+        for row in cursor:
+            if len(rows) == page_size:
+                has_more = True
+                break
+            rows.append(row)
+    finally:
+        cursor.close()
+
+    next_after = None
+    if has_more and rows:
+        positions = [header.index(c) for c in order_cols]
+        next_after = encode_cursor([rows[-1][p] for p in positions])
+
+    res = ResultSet(header, rows)
+    return res, next_after, estimate_rows(mysql, tablename)
+
+def escape_like(word):
+    '''
+    Escapes the LIKE wildcards (% and _) and the escape character in a search word
+    '''
+    return word.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def search_page(mysql, tablename, column, word, page_size=50, page=1):
+    '''
+    Searches one column of the table with a single parameterized query, best matches first
+    mysql: mysql connection object
+    tablename: name of the table
+    column: column to search, must be a column of the table
+    word: text to look for
+    page_size: maximum number of rows to return
+    page: page number, starting at 1
+
+    Columns with a FULLTEXT index of their own are searched with MATCH ... AGAINST in boolean mode with the
+    word as a phrase, so with the ngram parser a row matches only if it contains the word as a substring, and
+    rows are ranked by relevance. Words shorter than the ngram token size cannot be found that way; they and
+    columns without such an index fall back to a LIKE '%word%' scan, ranking exact matches first and then
+    by the position of the word in the value.
+
+    Return
+    res: ResultSet with the column names as header and the matching rows of the requested page
+    has_more: True if there are more matching rows after this page
+    mode: 'fulltext' or 'like', the way the column was searched
+    '''
+    if column not in catalog.columns(mysql, tablename):
+        raise ValueError(f"Unknown column {column} for {tablename}")
+    key_cols = ", ".join(catalog.primary_key_columns(mysql, tablename) or [catalog.primary_key(mysql, tablename)])
+    page = max(1, int(page))
+
+    # Double quotes would end the phrase; the other boolean operators are literal inside it
+    phrase = word.replace('"', ' ').strip()
+    if (column in catalog.fulltext_columns(mysql, tablename)
+            and len(phrase) >= catalog.ngram_token_size(mysql)):
+        mode = 'fulltext'
+        match = f"MATCH ({column}) AGAINST (%s IN BOOLEAN MODE)"
+        query = f"SELECT * FROM {tablename} WHERE {match} ORDER BY {match} DESC, {key_cols}"
+        params = ['"' + phrase + '"'] * 2
+    else:
+        mode = 'like'
+        query = (f"SELECT * FROM {tablename} WHERE {column} LIKE %s "
+                 f"ORDER BY {column} = %s DESC, LOCATE(%s, {column}), {key_cols}")
+        params = ['%' + escape_like(word) + '%', word, word]
+    # One extra row tells us if another page exists
+    query += " LIMIT %s OFFSET %s"
+    params += [int(page_size) + 1, (page - 1) * int(page_size)]
+
+    cursor = mysql.connection.cursor(MySQLdb.cursors.Cursor)
+    cursor.execute(query, params)
+    header = [d[0] for d in cursor.description]
+    rows = cursor.fetchall()
+    cursor.close()
+
+    has_more = len(rows) > page_size
+    return ResultSet(header, rows[:page_size]), has_more, mode
+
+def primary_key(mysql, tablename):
+    '''
+    Obtains the name of the first primary key column of the table (read from the schema catalog)
+    mysql: mysql connection object
+    tablename: name of the table
+
+    Return
+    res: Name of the first primary key column (the first column if the table has no primary key)
+    '''
+    return catalog.primary_key(mysql, tablename)
+
+def select_rows(mysql, tablename, where_condition, params=(), lock=False):
+    '''
+    Selects only the rows satisfying the where condition
+    mysql: mysql connection object
+    tablename: name of the table
+    where_condition: where condition in the mysql format, with %s placeholders for params
+    params: parameters for the placeholders in where_condition
+    lock: if True the rows are locked (SELECT ... FOR UPDATE) until the transaction ends
+
+    Return
+    header: List of column names
+    rows: List of the matching rows, each a tuple
+    '''
+    cursor = mysql.connection.cursor(MySQLdb.cursors.Cursor)
+    query = f"SELECT * FROM {tablename} WHERE {where_condition}"
+    if lock:
+        query += " FOR UPDATE"
+    cursor.execute(query, params)
+    header = [d[0] for d in cursor.description]
+    rows = list(cursor.fetchall())
+    cursor.close()
+    return header, rows
+
+def select_by_keys(mysql, tablename, key, keys, lock=False):
+    '''
+    Selects the rows whose primary key is in keys
+    mysql: mysql connection object
+    tablename: name of the table
+    key: name of the primary key column
+    keys: List of primary key values
+    lock: if True the rows are locked (SELECT ... FOR UPDATE) until the transaction ends
+
+    Return
+    header: List of column names
+    rows: List of the matching rows, each a tuple
+    '''
+    if not keys:
+        return select_rows(mysql, tablename, "FALSE")
+    placeholders = ', '.join(['%s'] * len(keys))
+    return select_rows(mysql, tablename, f"{key} IN ({placeholders})", list(keys), lock=lock)
+
+def row_condition(mysql, tablename, key_values):
+    '''
+    Builds the where condition selecting one row by all the columns of its primary key
+    mysql: mysql connection object
+    tablename: name of the table
+    key_values: List of the primary key values of the row, in the order of catalog.primary_key_columns
+
+    Return
+    condition: where condition with one %s placeholder per primary key column
+    params: parameters for the placeholders
+
+    Raises ValueError if the table has no primary key (its rows cannot be told apart) or key_values does not
+    hold one value per primary key column
+    '''
+    keys = catalog.primary_key_columns(mysql, tablename)
+    if not keys:
+        raise ValueError(f"{tablename} has no primary key, its rows cannot be changed one by one")
+    if not isinstance(key_values, (list, tuple)) or len(key_values) != len(keys):
+        raise ValueError(f"Expected a value for each primary key column of {tablename}: {', '.join(keys)}")
+    return " AND ".join(f"{key} = %s" for key in keys), list(key_values)
+
+def select_row(mysql, tablename, key_values, lock=False):
+    '''
+    Selects a single row by its primary key
+    mysql: mysql connection object
+    tablename: name of the table
+    key_values: List of the primary key values of the row (see row_condition)
+    lock: if True the row is locked (SELECT ... FOR UPDATE) until the transaction ends
+
+    Return
+    header: List of column names
+    row: The row as a tuple, or None if there is no row with that key
+    '''
+    condition, params = row_condition(mysql, tablename, key_values)
+    header, rows = select_rows(mysql, tablename, condition, params, lock=lock)
+    return header, (rows[0] if rows else None)
+
+def change_set(tablename, key, header, before, after, rowcount):
+    '''
+    Builds the compact description of a write returned by the insert/update/delete helpers
+    tablename: name of the table that was modified
+    key: name of the (first) primary key column
+    header: List of column names
+    before: rows touched by the statement, as they were before it ran
+    after: the same rows after the statement ran
+    rowcount: number of rows reported by the database as affected
+
+    Return
+    res: Dictionary with table, key, columns, keys (affected primary keys), before, after and rowcount
+    '''
+    pos = header.index(key)
+    keys = []
+    for row in before + after:
+        if row[pos] not in keys:
+            keys.append(row[pos])
+    return {
+        'table': tablename,
+        'key': key,
+        'columns': header,
+        'keys': keys,
+        'before': before,
+        'after': after,
+        'rowcount': rowcount,
+    }
+
 def insert_to_table(mysql, tablename, columnlist, val_list):
     '''
     Inserts a row into the specified table
@@ -139,11 +566,12 @@ def insert_to_table(mysql, tablename, columnlist, val_list):
     val_list: List of corresponding values to be inserted
 
     Return
-    res1: Contents of the table before the insert statement, as a list of lists
-    res2: Contents of the table after the insert statement, as a list of lists
+    res: Change set (see change_set) holding the inserted row
     '''
-    res1 = select_with_headers(mysql, tablename) # before the operation
-    cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+    key = primary_key(mysql, tablename)
+    keys = catalog.primary_key_columns(mysql, tablename)
+    columnlist = list(columnlist)
+    cursor = mysql.connection.cursor()
     
     # Build the query with proper parameterization
     cols_string = list_to_string(columnlist)
@@ -151,56 +579,224 @@ def insert_to_table(mysql, tablename, columnlist, val_list):
     query = f"INSERT INTO {tablename} {cols_string} VALUES ({placeholders})"
     
     cursor.execute(query, val_list)
+    rowcount = cursor.rowcount
+    lastrowid = cursor.lastrowid
+    cursor.close()
+
+    if keys:
+        # Key columns that were not given are the auto increment key
+        new_key = [val_list[columnlist.index(k)] if k in columnlist else lastrowid for k in keys]
+        header, row = select_row(mysql, tablename, new_key)
+        after = [row] if row is not None else []
+    else:
+        # No primary key: the rows holding the inserted values
+        condition = " AND ".join(f"{col} <=> %s" for col in columnlist) or "FALSE"
+        header, after = select_rows(mysql, tablename, condition, list(val_list))
     mysql.connection.commit()
-    cursor.fetchall()
-    res2 = select_with_headers(mysql, tablename) # after the operation
-    
-    return res1, res2
+    fragments.bump(tablename)
+    change = change_set(tablename, key, header, [], after, rowcount)
+    search_index.apply(change)
+    return change
 
-def delete_from_table(mysql, tablename, where_condition):
+def delete_from_table(mysql, tablename, key_values):
     '''
-    Deletes all rows (satisfying the where condition)
+    Deletes the row with the given primary key. Tables without a primary key are refused (ValueError).
     mysql: mysql connection object
-    tablename: name of the table whose columns we have to findcolumnlist: List of columns of the table
-    where_condition: entire where condition in the mysql format, including ANDs and ORs, as a string
+    tablename: name of the table
+    key_values: List of the primary key values of the row to delete (see row_condition)
     
     Return
-    res1: Contents of the table before the delete statement, as a list of lists
-    res2: Contents of the table after the delete statement, as a list of lists
+    res: Change set (see change_set) holding the deleted row
     '''
-    res1 = select_with_headers(mysql, tablename) # before the operation
-    cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+    key = primary_key(mysql, tablename)
+    condition, params = row_condition(mysql, tablename, key_values)
+    # The row is locked so the change set matches what is deleted
+    header, before = select_rows(mysql, tablename, condition, params, lock=True)
+    cursor = mysql.connection.cursor()
     
-    # Note: where_condition still needs to be prepared by the caller with proper parameter binding
-    query = f"DELETE FROM {tablename} WHERE {where_condition}"
-    cursor.execute(query)
+    query = f"DELETE FROM {tablename} WHERE {condition}"
+    cursor.execute(query, params)
+    rowcount = cursor.rowcount
+    cursor.close()
     
     mysql.connection.commit()
-    cursor.fetchall()
-    res2 = select_with_headers(mysql, tablename) # after the operation
-    return res1, res2
+    fragments.bump(tablename)
+    change = change_set(tablename, key, header, before, [], rowcount)
+    search_index.apply(change)
+    return change
 
-def update_table(mysql, tablename, set_statement, where_condition):
+def update_table(mysql, tablename, values, key_values):
     '''
-    Updates all rows according to the set statement (satisfying the where condition)
+    Updates the row with the given primary key. Tables without a primary key are refused (ValueError).
     mysql: mysql connection object
-    tablename: name of the table whose columns we have to findcolumnlist: List of columns of the table
-    set_statement: string containing the assignment statement for the update statement
-    where_condition: entire where condition, including ANDs and ORs, as a string
+    tablename: name of the table
+    values: Dictionary mapping the columns to update to their new values
+    key_values: List of the primary key values of the row to update (see row_condition)
     
     Return
-    res1: Contents of the table before the update statement, as a list of lists
-    res2: Contents of the table after the update statement, as a list of lists
+    res: Change set (see change_set) holding the old and new values of the updated row
     '''
-    res1 = select_with_headers(mysql, tablename) # before the operation
-    cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+    key = primary_key(mysql, tablename)
+    condition, params = row_condition(mysql, tablename, key_values)
+    header, before = select_rows(mysql, tablename, condition, params, lock=True)
+    cursor = mysql.connection.cursor()
     
-    # Note: set_statement and where_condition still need to be prepared by the caller with proper parameter binding
-    query = f"UPDATE {tablename} SET {set_statement} WHERE {where_condition}"
-    cursor.execute(query)
+    set_statement = ", ".join(f"{col} = %s" for col in values)
+    query = f"UPDATE {tablename} SET {set_statement} WHERE {condition}"
+    cursor.execute(query, list(values.values()) + params)
+    rowcount = cursor.rowcount
+    cursor.close()
     
+    # The key itself may have been updated
+    new_key = [values.get(k, v) for k, v in zip(catalog.primary_key_columns(mysql, tablename), params)]
+    header, row = select_row(mysql, tablename, new_key)
+    after = [row] if row is not None else []
     mysql.connection.commit()
-    cursor.fetchall()
-    res2 = select_with_headers(mysql, tablename) # after the operation
-    return res1, res2
+    fragments.bump(tablename)
+    change = change_set(tablename, key, header, before, after, rowcount)
+    search_index.apply(change)
+    return change
+
+def parse_value(col_type, raw):
+    '''
+    Converts a raw (string) value from an import file to the python value for a column
+    col_type: mysql column type as stored in the schema catalog, e.g. "varchar(100)", "int", "enum('a','b')"
+    raw: value read from the file
+
+    Return
+    res: Converted value
+
+    Raises ValueError if the value does not fit the column type
+    '''
+    if raw is None:
+        return None
+    if not isinstance(raw, str):
+        raw = str(raw)
+    raw = raw.strip()
+    base = col_type.split('(')[0].split(' ')[0].lower()
+
+    if base in ('tinyint', 'smallint', 'mediumint', 'int', 'integer', 'bigint', 'bit', 'bool', 'boolean'):
+        if raw.lower() in ('true', 'false'):
+            return int(raw.lower() == 'true')
+        try:
+            return int(raw)
+        except ValueError:
+            raise ValueError(f"{raw!r} is not an integer")
+    if base in ('decimal', 'numeric', 'float', 'double', 'real'):
+        try:
+            return Decimal(raw)
+        except InvalidOperation:
+            raise ValueError(f"{raw!r} is not a number")
+    if base == 'date':
+        return datetime.strptime(raw, '%Y-%m-%d').date()
+    if base in ('datetime', 'timestamp'):
+        return datetime.fromisoformat(raw)
+    if base == 'enum':
+        choices = re.findall(r"'((?:[^']|'')*)'", col_type)
+        if raw not in choices:
+            raise ValueError(f"{raw!r} is not one of {', '.join(choices)}")
+        return raw
+    if base in ('char', 'varchar'):
+        length = re.search(r'\((\d+)\)', col_type)
+        if length and len(raw) > int(length.group(1)):
+            raise ValueError(f"longer than {length.group(1)} characters")
+    return raw
+
+def validate_row(columns, schema, record):
+    '''
+    Validates one record of an import file against the cached schema of the table
+    columns: List of the columns being imported (the header of the file)
+    schema: Dictionary mapping column name to (column type, nullable), see bulk_insert
+    record: Dictionary mapping column name to raw value
+
+    Return
+    values: List of converted values, in the order of columns
+
+    Raises ValueError describing the first problem found
+    '''
+    extra = set(record) - set(columns)
+    if extra:
+        # csv.DictReader files surplus fields under the key None
+        raise ValueError(f"unexpected column(s) {', '.join(sorted(str(col) for col in extra))}")
+    values = []
+    for col in columns:
+        col_type, nullable = schema[col]
+        raw = record.get(col)
+        if raw is None or raw == '':
+            if not nullable:
+                raise ValueError(f"{col} is required")
+            values.append(None)
+            continue
+        try:
+            values.append(parse_value(col_type, raw))
+        except ValueError as e:
+            raise ValueError(f"{col}: {e}")
+    return values
+
+def bulk_insert(mysql, tablename, records, chunk_size=500):
+    '''
+    Inserts many rows from an import file, validating them against the schema catalog
+    mysql: mysql connection object
+    tablename: name of the table
+    records: Iterable of (line number, record dictionary), read lazily from the file.
+             All records must use the columns of the first one. A record may instead be the
+             ValueError raised while reading its line, it is reported as that line's error.
+    chunk_size: number of rows inserted with one executemany and committed together
+
+    Return
+    inserted: number of rows inserted
+    errors: List of (line number, error message) for the rows that were rejected
+    '''
+    known = {col[0]: (col[1], col[2] == 'YES') for col in catalog.describe(mysql, tablename)}
+    columns = None
+    query = None
+    inserted = 0
+    errors = []
+    chunk = []
+
+    def flush():
+        nonlocal inserted
+        if not chunk:
+            return
+        cursor = mysql.connection.cursor()
+        try:
+            cursor.executemany(query, [values for _, values in chunk])
+            mysql.connection.commit()
+            inserted += len(chunk)
+        except MySQLdb.Error:
+            mysql.connection.rollback()
+            # Retry one row at a time so the failing rows can be reported and the others kept
+            for line, values in chunk:
+                try:
+                    cursor.execute(query, values)
+                    inserted += 1
+                except MySQLdb.Error as e:
+                    errors.append((line, str(e.args[-1]) if e.args else str(e)))
+            mysql.connection.commit()
+        finally:
+            cursor.close()
+        chunk.clear()
+
+    for line, record in records:
+        if isinstance(record, ValueError):
+            errors.append((line, str(record)))
+            continue
+        if columns is None:
+            columns = list(record)
+            unknown = [col for col in columns if col not in known]
+            if unknown:
+                raise ValueError(f"Unknown column(s) for {tablename}: {', '.join(unknown)}")
+            placeholders = ', '.join(['%s'] * len(columns))
+            query = f"INSERT INTO {tablename} {list_to_string(columns)} VALUES ({placeholders})"
+        try:
+            chunk.append((line, validate_row(columns, known, record)))
+        except ValueError as e:
+            errors.append((line, str(e)))
+        if len(chunk) >= chunk_size:
+            flush()
+    flush()
+    if inserted:
+        fragments.bump(tablename)
+        search_index.invalidate(tablename)
 
+    return inserted, errors